@@ -0,0 +1,204 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    analysis_id TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL,
+    patient_id TEXT,
+    image_hash TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    primary_condition TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    probabilities TEXT NOT NULL,
+    profile TEXT,
+    stage TEXT
+);
+-- Keyset pagination walks these indexes newest-first (id DESC), so pages stay O(page size)
+CREATE INDEX IF NOT EXISTS idx_analyses_patient ON analyses (patient_id, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_condition ON analyses (primary_condition, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_image_hash ON analyses (image_hash);
+"""
+
+COLUMNS = ('id', 'analysis_id', 'created_at', 'patient_id', 'image_hash', 'model_version',
+           'primary_condition', 'confidence', 'probabilities', 'profile', 'stage')
+
+class AnalysisStore:
+    """Embedded SQLite (WAL) history of classifications with a background batching writer
+
+    record() only enqueues; a single writer thread drains the queue and commits rows in
+    batches, so inserts never run on the request path. Readers use their own connections,
+    which WAL mode lets proceed concurrently with the writer. Rows stay visible to get()
+    while they wait for the writer, so a client can read back an id it was just given.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 256, flush_interval: float = 0.5, max_pending: int = 100_000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._local = threading.local()
+        self._writer = None
+        self._stopping = threading.Event()
+        # analysis_id -> row for rows queued but not yet committed
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL durable against application crashes at a fraction of FULL's fsync cost
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """One read connection per thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        self._stopping.clear()
+        self._writer = threading.Thread(target=self._write_loop, name="analysis-store-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush pending rows and stop the writer"""
+        self._stopping.set()
+        if self._writer is not None:
+            self._writer.join(timeout)
+            self._writer = None
+
+    def record(self, image_hash: str, model_version: str, probabilities: Dict[str, float],
+               primary_condition: str, confidence: float, patient_id: Optional[str] = None,
+               profile: Optional[str] = None, stage: Optional[str] = None) -> str:
+        """Queue a classification for storage and return its analysis id immediately"""
+        analysis_id = uuid.uuid4().hex
+        row = (
+            analysis_id,
+            datetime.now().isoformat(),
+            patient_id,
+            image_hash,
+            model_version,
+            primary_condition,
+            confidence,
+            json.dumps(probabilities),
+            profile,
+            stage,
+        )
+        with self._pending_lock:
+            self._pending[analysis_id] = row
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._pending_lock:
+                del self._pending[analysis_id]
+            # Never block a request on storage; the drop is visible in stats()
+            self.dropped += 1
+        return analysis_id
+
+    def _write_loop(self):
+        conn = self._connect()
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.01)))
+                except queue.Empty:
+                    break
+                if time.monotonic() >= deadline:
+                    break
+
+            if not batch:
+                continue
+
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO analyses (analysis_id, created_at, patient_id, image_hash, model_version, "
+                        "primary_condition, confidence, probabilities, profile, stage) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch
+                    )
+                self.written += len(batch)
+                self.batches += 1
+            except sqlite3.Error as e:
+                print(f"Error writing analysis batch: {str(e)}")
+                self.dropped += len(batch)
+            # Committed rows are now readable from SQLite; dropped ones are gone for good
+            with self._pending_lock:
+                for row in batch:
+                    self._pending.pop(row[0], None)
+        conn.close()
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record['probabilities'] = json.loads(record['probabilities'])
+        return record
+
+    def get(self, analysis_id: str) -> Optional[Dict]:
+        """Fetch one analysis by its public id, including one still waiting for the writer"""
+        with self._pending_lock:
+            pending = self._pending.get(analysis_id)
+        if pending is not None:
+            # Not inserted yet, so it has no row id
+            return self._row_to_dict(dict(zip(COLUMNS, (None, *pending))))
+        row = self._reader().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM analyses WHERE analysis_id = ?", (analysis_id,)
+        ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def history(self, patient_id: Optional[str] = None, condition: Optional[str] = None,
+                cursor: Optional[int] = None, limit: int = 50) -> Dict:
+        """Newest-first page of analyses; pass next_cursor back to get the following page"""
+        clauses = []
+        params = []
+        if patient_id is not None:
+            clauses.append("patient_id = ?")
+            params.append(patient_id)
+        if condition is not None:
+            clauses.append("primary_condition = ?")
+            params.append(condition)
+        if cursor is not None:
+            # Keyset pagination: seek past the last id instead of OFFSET, which rescans skipped rows
+            clauses.append("id < ?")
+            params.append(cursor)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM analyses {where} ORDER BY id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        items = [self._row_to_dict(row) for row in rows[:limit]]
+        next_cursor = items[-1]['id'] if len(rows) > limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def stats(self) -> Dict:
+        return {
+            'db_path': os.path.abspath(self.db_path),
+            'pending': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+        }
@@ -1,23 +1,33 @@
+import time
+STARTED_AT = time.perf_counter()  # Import and startup timings in /api/ready are measured from here
 import os
-import base64
-import io
 import json
-from typing import Dict, Any
-from fastapi import FastAPI, HTTPException
+import base64
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Literal, Tuple
+from fastapi import FastAPI, HTTPException, Request, WebSocket, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import torch
-import torch.nn as nn
-import torchvision.transforms as transforms
 from PIL import Image
 import numpy as np
-from efficientnet_pytorch import EfficientNet
-from report_generator import MedicalReportGenerator
+from inference_scheduler import InferenceScheduler, DeadlineExceeded, QueueFull, ClientDisconnected
+import image_guard
+from stream_classifier import StreamBatcher
+from crop_sessions import CropSessionStore, crop_images
+from blob_store import BlobStore
+from analysis_store import AnalysisStore
+from explainability import GradCAM, SaliencyCache
 from datetime import datetime
 
 app = FastAPI(title="MedicImage API", description="AI Skin Disease Classifier API", version="2.0.0")
 
+# Cap request bodies before they are read into memory (added first so CORS wraps its 413s)
+app.add_middleware(image_guard.RequestSizeLimitMiddleware, max_bytes=image_guard.MAX_REQUEST_BYTES)
+image_guard.apply_pil_pixel_limit()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -31,11 +41,77 @@ app.add_middleware(
 model = None
 device = None
 class_names = ['Acne', 'Actinic Keratosis', 'Basal Cell Carcinoma', 'Eczemaa', 'Rosacea']
-report_generator = MedicalReportGenerator()
+
+# torch and the model code are imported by load_model() on a background thread, so importing
+# this module and answering /api/health never waits on them; /api/ready flips once they are warm
+torch = None
+ready = False
+startup_error = None
+startup_timings = {}
+
+# Created on first report (or once the models are warm), which is when ReportLab gets imported
+report_generator = None
+report_generator_lock = threading.Lock()
+
+# Decoded uploads kept so repeated crops need neither re-upload nor re-decode
+crop_sessions = CropSessionStore(
+    max_sessions=int(os.environ.get('CROP_SESSION_MAX', '64')),
+    max_bytes=int(os.environ.get('CROP_SESSION_MAX_MB', '512')) * 1024 * 1024,
+    ttl_seconds=float(os.environ.get('CROP_SESSION_TTL', '600'))
+)
+MAX_CROPS_PER_REQUEST = 16
+
+# Uploaded images stored once by content hash, with report thumbnails rendered on ingest
+blob_store = BlobStore(
+    os.environ.get('BLOB_STORE_DIR', os.path.join(os.path.dirname(__file__), 'blob_store')),
+    max_bytes=int(os.environ.get('BLOB_STORE_MAX_MB', '2048')) * 1024 * 1024
+)
+
+# Grad-CAM heatmaps by image hash, reused by the report step
+saliency_cache = SaliencyCache(int(os.environ.get('SALIENCY_CACHE_SIZE', '256')))
+
+# Worker/thread/batch configuration chosen for this machine's CPUs
+runtime_config = None
+
+# Resolution profiles (name -> model/transform/image_size) and current classify load
+profiles = {}
+inflight_requests = 0
+
+# Optional fast first-stage model; confident answers skip the full model
+cascade = None
+CASCADE_MODEL_PATH = os.environ.get('CASCADE_MODEL_PATH')  # Defaults to ML_DIR/disease_classifier_student.pth
+CASCADE_THRESHOLD = float(os.environ.get('CASCADE_THRESHOLD', '0.9'))
+
+# Seed ensemble evaluated in one batched call (comma-separated checkpoint paths)
+ensemble = None
+ENSEMBLE_CHECKPOINTS = [path for path in os.environ.get('ENSEMBLE_CHECKPOINTS', '').split(',') if path]
+
+# Candidate model evaluated on a sample of live traffic, off the response path
+shadow = None
+SHADOW_MODEL_PATH = os.environ.get('SHADOW_MODEL_PATH')  # Defaults to ML_DIR/disease_classifier_candidate.pth
+
+# Priority/deadline-aware queue in front of the model
+scheduler = InferenceScheduler(
+    concurrency=int(os.environ.get('SCHEDULER_CONCURRENCY', '2')),
+    max_queue=int(os.environ.get('SCHEDULER_MAX_QUEUE', '1000'))
+)
+
+# Every classification is recorded off the request path by a batching writer
+analysis_store = AnalysisStore(os.environ.get('ANALYSIS_DB_PATH', os.path.join(os.path.dirname(__file__), 'analysis_history.db')))
 
 # Pydantic models for request/response
 class ClassificationRequest(BaseModel):
-    image: str
+    image: Optional[str] = None  # Base64 image; send either this or blob_id
+    blob_id: Optional[str] = None  # Image stored earlier with POST /api/blobs
+    profile: Optional[str] = None  # Resolution profile name, or None/"auto" to pick by load
+    cascade: Optional[bool] = None  # Override the server's cascade mode for this request
+    ensemble: Optional[bool] = None  # Override the server's ensemble mode for this request
+    priority: Literal["interactive", "bulk"] = "interactive"
+    client_id: Optional[str] = None  # Fair-queuing key; defaults to X-Client-Id or the caller's address
+    deadline_ms: Optional[int] = None  # Drop the request if it has not reached the model within this time
+    patient_id: Optional[str] = None  # Stored with the analysis for per-patient history
+    explain: bool = False  # Return Grad-CAM heatmaps (always computed on the full model)
+    explain_top_k: int = 1  # Number of top classes to explain
 
 class ClassificationResponse(BaseModel):
     success: bool
@@ -43,74 +119,377 @@ class ClassificationResponse(BaseModel):
     primary_condition: str
     confidence: float
     class_names: list
+    profile: Optional[str] = None
+    stage: str = "full"  # Which stage answered: "fast", "full" or "ensemble"
+    analysis_id: Optional[str] = None  # History record id, usable in /api/generate-report
+    heatmaps: Optional[Dict[str, List[List[float]]]] = None  # Class -> low-resolution Grad-CAM map in [0, 1]
+    member_predictions: Optional[List[Dict[str, float]]] = None  # Per-checkpoint probabilities when the ensemble answered
 
-class ReportRequest(BaseModel):
+class BlobRequest(BaseModel):
+    image: str
+
+class BlobResponse(BaseModel):
+    blob_id: str  # SHA-256 of the image bytes, usable as blob_id in classify and report requests
+    created: bool  # False when the same image was already stored
+    size_bytes: int
+
+class SessionRequest(BaseModel):
     image: str
-    analysis_data: Dict[str, Any]
+
+class SessionResponse(BaseModel):
+    session_id: str
+    width: int
+    height: int
+    expires_in: float  # Seconds of inactivity before the session is dropped
+
+class CropRect(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+
+class CropClassificationRequest(BaseModel):
+    crops: List[CropRect] = []  # Rectangles in original image pixels; empty classifies the whole image
+    profile: Optional[str] = None
+    priority: Literal["interactive", "bulk"] = "interactive"
+    client_id: Optional[str] = None
+    patient_id: Optional[str] = None  # Groups the stored analyses per patient, as for /api/classify
+
+class CropClassificationResponse(BaseModel):
+    success: bool
+    session_id: str
+    results: List[ClassificationResponse]  # One per crop, in request order
+
+class ReportRequest(BaseModel):
+    image: Optional[str] = None  # Base64 image; or blob_id, or neither to use the analysis_id's stored image
+    blob_id: Optional[str] = None  # Stored image; the report embeds its pre-rendered thumbnail
+    analysis_data: Dict[str, Any] = {}
+    analysis_id: Optional[str] = None  # Load predictions from the history store instead of analysis_data
+    engine: Optional[Literal["platypus", "canvas"]] = None  # PDF rendering engine; defaults to REPORT_ENGINE
     patient_name: str = "Mr Ramzi Houidi"
+    include_heatmap: bool = True  # Overlay the cached Grad-CAM heatmap if the image was explained
 
 class HealthResponse(BaseModel):
     status: str
     message: str
 
+class ReadinessResponse(BaseModel):
+    ready: bool
+    error: Optional[str] = None  # Why loading failed; the API then stays unready
+    timings_ms: Dict[str, float]  # Import and startup phases, in milliseconds
+
 class ModelInfoResponse(BaseModel):
     model_type: str
     num_classes: int
     class_names: list
     device: str
+    profiles: list = []
+    runtime: Optional[Dict[str, Any]] = None
+
+def record_startup_phase(name: str, start: float) -> float:
+    """Store how long a startup phase took and return the start of the next one"""
+    now = time.perf_counter()
+    startup_timings[name] = round((now - start) * 1000, 1)
+    return now
 
 def load_model():
     """Load the classification-based EfficientNet model"""
-    global model, device
+    global torch, model, device, profiles, cascade, ensemble, runtime_config, shadow
+    
+    start = time.perf_counter()
+    import torch
+    import runtime_tuner
+    from model_loader import load_classifier, load_resolution_profiles, DEFAULT_CLASSIFIER_PATH, ML_DIR
+    from cascade import ModelCascade
+    from ensemble import CheckpointEnsemble
+    from shadow import ShadowEvaluator
+    start = record_startup_phase('inference_imports_ms', start)
     
     # Set device (CPU for simplicity)
     device = torch.device("cpu")
     
-    # Load classification model
-    model = EfficientNet.from_pretrained('efficientnet-b0')
-    model._fc = nn.Linear(model._fc.in_features, len(class_names))
+    # Load classification model (a distilled student can be dropped in via DISEASE_CLASSIFIER_PATH)
+    classifier_path = os.environ.get('DISEASE_CLASSIFIER_PATH', DEFAULT_CLASSIFIER_PATH)
     
-    classifier_path = os.path.join(os.path.dirname(__file__), '..', '#ML', 'DermaScan', 'disease_classifier.pth')
-    if os.path.exists(classifier_path):
-        model.load_state_dict(torch.load(classifier_path, map_location=device))
-        print(f"Loaded classification model from {classifier_path}")
-    else:
-        raise FileNotFoundError(f"Classification model not found at {classifier_path}")
+    # Size torch's thread pools for the cores this worker actually gets (sweeps once per machine),
+    # shared between the forward passes the scheduler runs at once
+    runtime_config = runtime_tuner.load_or_tune(classifier_path, len(class_names))
+    runtime_config['threads_per_forward'] = runtime_tuner.apply_config(runtime_config, scheduler.concurrency)
+    start = record_startup_phase('runtime_tuning_ms', start)
+    if 'STREAM_MAX_BATCH' not in os.environ:
+        stream_batcher.max_batch = runtime_config['batch_size']
+    print(f"Runtime: {runtime_config['threads']} thread(s) per worker, "
+          f"{runtime_config['threads_per_forward']} per concurrent forward pass, batch {runtime_config['batch_size']} "
+          f"({runtime_config['source']}, {runtime_config['topology']['available_cpus']} CPUs available)")
+    
+    model = load_classifier(classifier_path, len(class_names), device)
+    print(f"Loaded classification model from {classifier_path}")
+    
+    # Load the resolution profiles that have a fine-tuned or validated checkpoint
+    profiles = load_resolution_profiles(classifier_path, model, len(class_names), device)
+    enabled = [f"{name} ({profile['image_size']}px)" for name, profile in profiles.items()]
+    
+    # One Grad-CAM hook per model; profiles without a fine-tuned checkpoint share the base model
+    explainers = {}
+    for profile in profiles.values():
+        profile['explainer'] = explainers.setdefault(id(profile['model']), GradCAM(profile['model']))
+    print(f"Resolution profiles enabled: {', '.join(enabled)}")
     
-    model.to(device)
-    model.eval()
+    # Load the cascade's first-stage model if one has been distilled
+    cascade_path = CASCADE_MODEL_PATH or os.path.join(ML_DIR, 'disease_classifier_student.pth')
+    if os.environ.get('CASCADE_ENABLED', '1') != '0' and os.path.exists(cascade_path):
+        cascade = ModelCascade(cascade_path, len(class_names), device, threshold=CASCADE_THRESHOLD)
+        print(f"Cascade enabled with {cascade_path} (threshold {CASCADE_THRESHOLD})")
+    
+    # Evaluate every seed checkpoint in one vectorized pass instead of one model after another
+    if ENSEMBLE_CHECKPOINTS:
+        ensemble = CheckpointEnsemble(ENSEMBLE_CHECKPOINTS, len(class_names), device)
+        cost = ensemble.measure_latency()
+        print(f"Ensemble of {len(ENSEMBLE_CHECKPOINTS)} checkpoints enabled ({ensemble.mode}): "
+              f"{cost['ensemble_ms']:.1f} ms vs {cost['single_ms']:.1f} ms for one model")
+        if ensemble.sequential:
+            print(f"Batched ensemble is slower than {cost['sequential_ms']:.1f} ms of members one after another; "
+                  f"evaluating them sequentially")
+    
+    # Mirror a sample of traffic to a candidate checkpoint awaiting promotion
+    shadow_path = SHADOW_MODEL_PATH or os.path.join(ML_DIR, 'disease_classifier_candidate.pth')
+    if os.environ.get('SHADOW_ENABLED', '1') != '0' and os.path.exists(shadow_path):
+        shadow = ShadowEvaluator(
+            shadow_path,
+            class_names,
+            sample_rate=float(os.environ.get('SHADOW_SAMPLE_RATE', '0.1')),
+            cpu_budget=float(os.environ.get('SHADOW_CPU_BUDGET', '0.25')),
+            log_path=os.environ.get('SHADOW_LOG_PATH', os.path.join(os.path.dirname(__file__), 'shadow_log.jsonl'))
+        )
+        print(f"Shadow mode enabled with {shadow_path}")
+    record_startup_phase('model_load_ms', start)
     print("Classification model loaded successfully!")
 
-def preprocess_image(image_data: str) -> torch.Tensor:
-    """Preprocess the image to match the training pipeline"""
-    # Decode base64 image
-    if image_data.startswith('data:image'):
-        # Remove data URL prefix
-        image_data = image_data.split(',')[1]
+def warm_up():
+    """Run every loaded model once so the first real request does not pay torch's lazy initialisation
+    
+    The ensemble needs nothing here: load_model() has already timed it.
+    """
+    warmed = set()
+    for profile in profiles.values():
+        if id(profile['model']) not in warmed:
+            warmed.add(id(profile['model']))
+            predict_probabilities(Image.new('RGB', (profile['image_size'], profile['image_size'])), profile)
+    if cascade is not None:
+        cascade.fast_probabilities(Image.new('RGB', (cascade.image_size, cascade.image_size)))
+
+def get_report_generator():
+    """The shared report generator, created (and ReportLab imported) on first use"""
+    global report_generator
+    with report_generator_lock:
+        if report_generator is None:
+            from report_generator import MedicalReportGenerator
+            report_generator = MedicalReportGenerator()
+    return report_generator
+
+def load_in_background():
+    """Load and warm the models off the event loop, then mark the API ready"""
+    global ready, startup_error
+    try:
+        print("Loading skin disease classifier model...")
+        load_model()
+        start = time.perf_counter()
+        warm_up()
+        record_startup_phase('warmup_ms', start)
+        if shadow is not None:
+            shadow.start()
+        ready = True
+        startup_timings['ready_after_ms'] = round((time.perf_counter() - STARTED_AT) * 1000, 1)
+        print(f"Ready after {startup_timings['ready_after_ms'] / 1000:.1f}s: {startup_timings}")
+        
+        # Reports do not need the model, but import ReportLab now rather than on the first one
+        start = time.perf_counter()
+        get_report_generator()
+        record_startup_phase('report_engine_ms', start)
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Error loading model: {startup_error}")
+
+def require_ready():
+    """Turn model-backed requests away with 503 until the background load has finished"""
+    if not ready:
+        detail = f"Model failed to load: {startup_error}" if startup_error else "Model is still loading; poll /api/ready"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+def select_profile(requested: Optional[str]) -> str:
+    """Pick a resolution profile: the requested one, or the largest one the current load allows"""
+    if requested and requested != "auto":
+        if requested not in profiles:
+            raise HTTPException(status_code=400, detail=f"Unknown resolution profile '{requested}'. Available: {list(profiles)}")
+        return requested
+    
+    # Largest resolution first; fall back to the smallest profile under heavy load
+    by_size = sorted(profiles, key=lambda name: profiles[name]['image_size'], reverse=True)
+    for name in by_size:
+        max_inflight = profiles[name]['max_inflight']
+        if max_inflight is None or inflight_requests <= max_inflight:
+            return name
+    return by_size[-1]
+
+def predict_probabilities(image: Image.Image, profile: Dict) -> np.ndarray:
+    """Run one decoded image through a resolution profile's model and return class probabilities"""
+    image_tensor = profile['transform'](image).unsqueeze(0).to(device)
+    
+    # Run inference
+    with torch.no_grad():
+        outputs = profile['model'](image_tensor)
+        # Apply softmax to get probabilities
+        probabilities = torch.softmax(outputs, dim=1)[0].cpu().numpy()
+    
+    return probabilities
+
+def classify_image(image_data: Optional[str], profile: Dict, use_cascade: bool, explain_top_k: int = 0,
+                   use_ensemble: bool = False, blob_id: Optional[str] = None):
+    """Decode once, then answer from the ensemble, the cascade's fast stage or the full model
+    
+    Returns (probabilities, stage, image_hash, heatmaps, member_probabilities); heatmaps is None
+    unless explain_top_k > 0 and member_probabilities is None unless the ensemble answered.
+    """
+    image_bytes = request_image_bytes(image_data, blob_id)
+    image_hash = blob_id or hashlib.sha256(image_bytes).hexdigest()
+    
+    if explain_top_k:
+        # Grad-CAM comes out of the same forward pass, so an explained image is never re-run
+        cached = saliency_cache.get(image_hash, profile['version'], explain_top_k)
+        if cached is None:
+            size = profile['image_size']
+            image = image_guard.open_image(image_bytes, (size, size)).convert('RGB')
+            image_tensor = profile['transform'](image).unsqueeze(0).to(device)
+            probabilities, heatmaps = profile['explainer'].explain(image_tensor, explain_top_k)
+            saliency_cache.put(image_hash, profile['version'], probabilities, heatmaps)
+            return probabilities, "full", image_hash, heatmaps, None
+        return cached['probabilities'], "full", image_hash, cached['heatmaps'][:explain_top_k], None
+    
+    start = time.perf_counter()
+    if use_ensemble:
+        image = image_guard.open_image(image_bytes, (ensemble.image_size, ensemble.image_size)).convert('RGB')
+        probabilities, member_probabilities = ensemble.classify(image)
+        if shadow is not None:
+            shadow.submit(image_bytes, image_hash, probabilities, (time.perf_counter() - start) * 1000, ensemble.version)
+        return probabilities, "ensemble", image_hash, None, member_probabilities
+    
+    min_size = max(profile['image_size'], cascade.image_size if use_cascade else 0)
+    image = image_guard.open_image(image_bytes, (min_size, min_size)).convert('RGB')
     
-    # Decode base64 to bytes
-    image_bytes = base64.b64decode(image_data)
+    if use_cascade:
+        probabilities, stage = cascade.classify(image, lambda img: predict_probabilities(img, profile))
+    else:
+        probabilities, stage = predict_probabilities(image, profile), "full"
+    
+    if shadow is not None:
+        # Non-blocking: the sample is dropped if the shadow process is busy
+        serving_ms = (time.perf_counter() - start) * 1000
+        shadow.submit(image_bytes, image_hash, probabilities, serving_ms,
+                      cascade.version if stage == "fast" else profile['version'])
     
-    # Open image with PIL
-    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    return probabilities, stage, image_hash, None, None
+
+def check_image_source(image_data: Optional[str], blob_id: Optional[str]):
+    """Require exactly one of an inline image or a stored blob, and reject bad ones before queueing"""
+    if (image_data is None) == (blob_id is None):
+        raise HTTPException(status_code=400, detail="Send either 'image' or 'blob_id'")
+    if image_data is not None:
+        image_guard.probe_image(image_data)
+        return
+    try:
+        stored = blob_store.info(blob_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Blob '{blob_id}' not found; upload the image to /api/blobs again")
+
+def stored_blob_thumbnail(blob_id: str) -> str:
+    """Thumbnail path of a stored blob; 400 for a malformed id, 404 once it is gone"""
+    try:
+        thumbnail_path = blob_store.thumbnail(blob_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if thumbnail_path is None:
+        raise HTTPException(status_code=404, detail=f"Blob '{blob_id}' not found; upload the image to /api/blobs again")
+    return thumbnail_path
+
+def request_image_bytes(image_data: Optional[str], blob_id: Optional[str]) -> bytes:
+    """Image bytes from the inline base64 payload, or from the blob store (validated on ingest)"""
+    if blob_id is None:
+        return image_guard.load_image_bytes(image_data)
+    image_bytes = blob_store.get(blob_id)
+    if image_bytes is None:
+        raise HTTPException(status_code=404, detail=f"Blob '{blob_id}' not found; upload the image to /api/blobs again")
+    return image_bytes
+
+def classify_crops(image: Image.Image, crops: List[Tuple[int, int, int, int]], profile: Dict) -> np.ndarray:
+    """Cut crops from cached pixels and classify them all in one forward pass"""
+    image_tensor = torch.stack([profile['transform'](crop) for crop in crop_images(image, crops)]).to(device)
+    with torch.no_grad():
+        outputs = profile['model'](image_tensor)
+        return torch.softmax(outputs, dim=1).cpu().numpy()
+
+def decode_session_image(image_data: str) -> Tuple[Image.Image, str]:
+    """Fully decode an upload for a crop session; crops are given in original pixel coordinates"""
+    image_bytes = image_guard.load_image_bytes(image_data)
+    image = image_guard.open_image(image_bytes).convert('RGB')
+    return image, hashlib.sha256(image_bytes).hexdigest()
+
+def client_key(client_id: Optional[str], http_request: Request) -> str:
+    """Fair-queuing key: explicit id, then X-Client-Id, then the caller's address"""
+    return client_id or http_request.headers.get('x-client-id') or (http_request.client.host if http_request.client else 'anonymous')
+
+def classify_frames(frames: List[Tuple[str, bytes]]) -> List:
+    """Classify raw camera frames in one forward pass per resolution profile"""
+    results = [None] * len(frames)
+    batches = {}
     
-    # Apply the same transformations as in the notebook
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+    for i, (profile_name, frame) in enumerate(frames):
+        profile = profiles[profile_name]
+        try:
+            image_guard.probe_image_bytes(frame)
+            size = profile['image_size']
+            image = image_guard.open_image(frame, (size, size)).convert('RGB')
+            batches.setdefault(profile_name, []).append((i, profile['transform'](image)))
+        except Exception as e:
+            results[i] = e
     
-    # Apply transformations and add batch dimension
-    image_tensor = transform(image).unsqueeze(0)
+    for profile_name, items in batches.items():
+        image_tensor = torch.stack([tensor for _, tensor in items]).to(device)
+        with torch.no_grad():
+            outputs = profiles[profile_name]['model'](image_tensor)
+            probabilities = torch.softmax(outputs, dim=1).cpu().numpy()
+        for (i, _), row in zip(items, probabilities):
+            results[i] = row
     
-    return image_tensor
+    return results
+
+# Live camera streaming: latest frame per connection, batched across connections
+stream_batcher = StreamBatcher(
+    classify_frames,
+    class_names,
+    submit=lambda fn, frames: scheduler.submit(fn, frames, priority='interactive', client_id='websocket-stream'),
+    max_batch=int(os.environ.get('STREAM_MAX_BATCH', '8'))
+)
 
 @app.on_event("startup")
 async def startup_event():
-    """Load the model when the application starts"""
-    print("Loading skin disease classifier model...")
-    load_model()
+    """Start the queues and writers, then load the model in the background"""
+    await scheduler.start()
+    await stream_batcher.start()
+    analysis_store.start()
+    threading.Thread(target=load_in_background, name="model-loader", daemon=True).start()
+    startup_timings['serving_after_ms'] = round((time.perf_counter() - STARTED_AT) * 1000, 1)
+    print(f"Serving after {startup_timings['serving_after_ms'] / 1000:.1f}s; the model is loading in the background")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the inference workers"""
+    await stream_batcher.stop()
+    await scheduler.stop()
+    analysis_store.stop()
+    if shadow is not None:
+        shadow.stop()
 
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
@@ -120,19 +499,39 @@ async def health_check():
         message="Skin Disease Classifier API is running"
     )
 
+@app.get("/api/ready", response_model=ReadinessResponse)
+async def readiness_check(response: Response):
+    """Readiness probe: 503 until the model is loaded and warm, with import/startup timings"""
+    if not ready:
+        response.status_code = 503
+    return ReadinessResponse(ready=ready, error=startup_error, timings_ms=startup_timings)
+
 @app.post("/api/classify", response_model=ClassificationResponse)
-async def classify_skin_disease(request: ClassificationRequest):
+async def classify_skin_disease(request: ClassificationRequest, http_request: Request):
     """Classify skin diseases from uploaded image"""
+    global inflight_requests
+    require_ready()
+    profile_name = select_profile(request.profile)
+    profile = profiles[profile_name]
+    
+    # Reject oversized or unsupported images from their header before they take a queue slot;
+    # a header past the probe window means decoding the whole payload, so keep it off the event loop
+    await run_in_threadpool(check_image_source, request.image, request.blob_id)
+    
+    inflight_requests += 1
     try:
-        # Preprocess the image
-        image_tensor = preprocess_image(request.image)
-        image_tensor = image_tensor.to(device)
-        
-        # Run inference
-        with torch.no_grad():
-            outputs = model(image_tensor)
-            # Apply softmax to get probabilities
-            probabilities = torch.softmax(outputs, dim=1)[0].cpu().numpy()
+        # Queue preprocessing and inference behind the scheduler, off the event loop
+        use_cascade = cascade is not None and request.cascade is not False
+        use_ensemble = ensemble is not None and request.ensemble is not False
+        client_id = client_key(request.client_id, http_request)
+        explain_top_k = min(max(request.explain_top_k, 1), len(class_names)) if request.explain else 0
+        probabilities, stage, image_hash, heatmaps, member_probabilities = await scheduler.submit(
+            classify_image, request.image, profile, use_cascade, explain_top_k, use_ensemble, request.blob_id,
+            priority=request.priority,
+            client_id=client_id,
+            deadline_ms=request.deadline_ms,
+            is_disconnected=http_request.is_disconnected
+        )
         
         # Create results dictionary
         results = {}
@@ -143,27 +542,265 @@ async def classify_skin_disease(request: ClassificationRequest):
         primary_condition = class_names[np.argmax(probabilities)]
         confidence = float(np.max(probabilities))
         
+        # Queue the record for the background writer; this never waits on SQLite
+        model_version = {"fast": cascade, "ensemble": ensemble}.get(stage)
+        # The ensemble runs at its own image size, so no resolution profile answered
+        answered_profile = None if stage == "ensemble" else profile_name
+        analysis_id = analysis_store.record(
+            image_hash=image_hash,
+            model_version=model_version.version if model_version is not None else profile['version'],
+            probabilities=results,
+            primary_condition=primary_condition,
+            confidence=confidence,
+            patient_id=request.patient_id,
+            profile=answered_profile,
+            stage=stage
+        )
+        
         return ClassificationResponse(
             success=True,
             predictions=results,
             primary_condition=primary_condition,
             confidence=confidence,
-            class_names=class_names
+            class_names=class_names,
+            profile=answered_profile,
+            stage=stage,
+            analysis_id=analysis_id,
+            heatmaps={
+                class_names[index]: np.round(heatmap.astype(np.float32), 3).tolist()
+                for index, heatmap in heatmaps
+            } if heatmaps else None,
+            member_predictions=[
+                {class_name: float(row[i]) for i, class_name in enumerate(class_names)}
+                for row in member_probabilities
+            ] if member_probabilities is not None else None
         )
         
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ClientDisconnected as e:
+        # Nobody is listening; 499 is the conventional "client closed request" status for the logs
+        raise HTTPException(status_code=499, detail=str(e))
     except Exception as e:
         print(f"Error during classification: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
+    finally:
+        inflight_requests -= 1
+
+@app.post("/api/blobs", response_model=BlobResponse)
+async def upload_blob(request: BlobRequest):
+    """Store an image once by content hash so later requests can send its blob_id instead"""
+    try:
+        image_bytes = await run_in_threadpool(image_guard.load_image_bytes, request.image)
+        blob_id, created = await run_in_threadpool(blob_store.put, image_bytes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error storing image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Storing image failed: {str(e)}")
+    
+    return BlobResponse(blob_id=blob_id, created=created, size_bytes=len(image_bytes))
+
+@app.get("/api/blobs/{blob_id}")
+async def get_blob(blob_id: str):
+    """Check whether an image is stored (clients can hash locally and skip the upload)"""
+    try:
+        info = blob_store.info(blob_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Blob '{blob_id}' not found")
+    return info
+
+@app.get("/api/blob-stats")
+async def get_blob_stats():
+    """Get blob store size, deduplication and eviction counters"""
+    return blob_store.stats()
+
+@app.post("/api/sessions", response_model=SessionResponse)
+async def create_crop_session(request: SessionRequest):
+    """Upload an image once and keep it decoded for crop classification"""
+    try:
+        image, image_hash = await run_in_threadpool(decode_session_image, request.image)
+        session = crop_sessions.create(image, image_hash)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Image could not be decoded: {str(e)}")
+    
+    return SessionResponse(
+        session_id=session.session_id,
+        width=image.width,
+        height=image.height,
+        expires_in=crop_sessions.expires_in(session)
+    )
+
+@app.post("/api/sessions/{session_id}/classify", response_model=CropClassificationResponse)
+async def classify_session_crops(session_id: str, request: CropClassificationRequest, http_request: Request):
+    """Classify one or more crops of a session's image in a single batched forward pass"""
+    require_ready()
+    session = crop_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found or expired")
+    if len(request.crops) > MAX_CROPS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CROPS_PER_REQUEST} crops per request")
+    
+    profile_name = select_profile(request.profile)
+    profile = profiles[profile_name]
+    crops = [(crop.x, crop.y, crop.width, crop.height) for crop in request.crops]
+    
+    try:
+        probabilities = await scheduler.submit(
+            classify_crops, session.image, crops, profile,
+            priority=request.priority,
+            client_id=client_key(request.client_id, http_request),
+            is_disconnected=http_request.is_disconnected
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ClientDisconnected as e:
+        raise HTTPException(status_code=499, detail=str(e))
+    except Exception as e:
+        print(f"Error during crop classification: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
+    
+    crop_sessions.record_crops(session, len(probabilities))
+    results = []
+    for row in probabilities:
+        predictions = {class_name: float(row[i]) for i, class_name in enumerate(class_names)}
+        primary_condition = class_names[int(np.argmax(row))]
+        confidence = float(np.max(row))
+        # Recorded like any classification; image_hash is the session's source image
+        analysis_id = analysis_store.record(
+            image_hash=session.image_hash,
+            model_version=profile['version'],
+            probabilities=predictions,
+            primary_condition=primary_condition,
+            confidence=confidence,
+            patient_id=request.patient_id,
+            profile=profile_name,
+            stage="full"
+        )
+        results.append(ClassificationResponse(
+            success=True,
+            predictions=predictions,
+            primary_condition=primary_condition,
+            confidence=confidence,
+            class_names=class_names,
+            profile=profile_name,
+            stage="full",
+            analysis_id=analysis_id
+        ))
+    return CropClassificationResponse(success=True, session_id=session_id, results=results)
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_crop_session(session_id: str):
+    """Release a session's cached image"""
+    if not crop_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found or expired")
+    return {"success": True}
+
+@app.get("/api/session-stats")
+async def get_session_stats():
+    """Get crop session cache counters"""
+    return crop_sessions.stats()
+
+@app.websocket("/api/stream")
+async def stream_classification(websocket: WebSocket, profile: str = "full", smoothing: float = 0.3):
+    """Classify a live camera feed sent as binary image frames"""
+    await websocket.accept()
+    if not ready:
+        await websocket.close(code=1013, reason="Model is still loading")
+        return
+    if profile not in profiles:
+        await websocket.close(code=1008, reason=f"Unknown resolution profile '{profile}'")
+        return
+    
+    session = stream_batcher.open_session(profile, smoothing, websocket.send_json)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes') is not None:
+                stream_batcher.push(session, message['bytes'])
+            elif message.get('text') == 'reset':
+                # Start smoothing afresh, e.g. after the camera moves to another lesion
+                session.reset()
+    finally:
+        stream_batcher.close_session(session)
+
+@app.get("/api/stream-stats")
+async def get_stream_stats():
+    """Get live streaming connection and batching counters"""
+    return stream_batcher.stats()
 
 @app.post("/api/generate-report")
 async def generate_medical_report(request: ReportRequest):
     """Generate a medical report PDF"""
+    if request.image is not None and request.blob_id is not None:
+        raise HTTPException(status_code=400, detail="Send either 'image' or 'blob_id', not both")
+    if request.image is not None:
+        await run_in_threadpool(image_guard.probe_image, request.image)
+    elif request.blob_id is None and request.analysis_id is None:
+        raise HTTPException(status_code=400, detail="Send 'image', 'blob_id' or 'analysis_id'")
+    
+    analysis_data = request.analysis_data
+    if request.analysis_id is not None:
+        stored = await run_in_threadpool(analysis_store.get, request.analysis_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail=f"Analysis '{request.analysis_id}' not found")
+        # Stored results fill in what the client did not send (recommendations/products stay client-side)
+        analysis_data = {
+            "predictions": stored['probabilities'],
+            "primary_condition": stored['primary_condition'],
+            "confidence": stored['confidence'],
+            **analysis_data
+        }
+    
+    # A stored image is embedded from its thumbnail; the history's image hash is its blob id
+    blob_id = request.blob_id
+    if blob_id is not None:
+        thumbnail_path = stored_blob_thumbnail(blob_id)
+    elif request.image is None:
+        # Inline classifications never reach the blob store (and blobs get evicted), so a report
+        # by analysis_id alone goes without the image instead of failing
+        thumbnail_path = blob_store.thumbnail(stored['image_hash'])
+    else:
+        thumbnail_path = None
+    has_image = request.image is not None or thumbnail_path is not None
+    
+    # Overlay the heatmap from an earlier explained classification of this exact image
+    saliency = None
+    if request.include_heatmap and has_image:
+        if blob_id is not None:
+            image_hash = blob_id
+        elif request.analysis_id is not None:
+            image_hash = stored['image_hash']
+        else:
+            image_hash = hashlib.sha256(base64.b64decode(image_guard.split_data_url(request.image)[1])).hexdigest()
+        cached = saliency_cache.get(image_hash)
+        if cached is not None:
+            index, heatmap = cached['heatmaps'][0]
+            saliency = (class_names[index], heatmap)
+    
     try:
         # Generate the PDF report
-        pdf_bytes = report_generator.create_report(
-            analysis_data=request.analysis_data,
+        pdf_bytes = get_report_generator().create_report(
+            analysis_data=analysis_data,
             image_data=request.image,
-            patient_name=request.patient_name
+            patient_name=request.patient_name,
+            engine=request.engine,
+            saliency=saliency,
+            thumbnail_path=thumbnail_path
         )
         
         # Return the PDF as a downloadable file
@@ -179,6 +816,65 @@ async def generate_medical_report(request: ReportRequest):
         print(f"Error generating report: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
 
+@app.get("/api/cascade-stats")
+async def get_cascade_stats():
+    """Get cascade escalation counters for threshold tuning"""
+    if cascade is None:
+        return {"enabled": False}
+    return {"enabled": True, **cascade.stats()}
+
+@app.get("/api/ensemble-stats")
+async def get_ensemble_stats():
+    """Get ensemble members, call counters and the latency cost against a single model"""
+    if ensemble is None:
+        return {"enabled": False}
+    return {"enabled": True, **ensemble.stats()}
+
+@app.get("/api/saliency-stats")
+async def get_saliency_stats():
+    """Get Grad-CAM heatmap cache counters"""
+    return saliency_cache.stats()
+
+@app.get("/api/shadow-stats")
+async def get_shadow_stats():
+    """Get candidate-vs-serving agreement and latency counters"""
+    if shadow is None:
+        return {"enabled": False}
+    return {"enabled": True, **shadow.stats()}
+
+@app.get("/api/scheduler-stats")
+async def get_scheduler_stats():
+    """Get per-priority queue depths, drop counters and queue wait times"""
+    return scheduler.stats()
+
+@app.get("/api/ingest-stats")
+async def get_ingest_stats():
+    """Get upload acceptance/rejection counters and the decode work avoided"""
+    return image_guard.ingest_stats.as_dict()
+
+@app.get("/api/history")
+async def get_analysis_history(
+    patient_id: Optional[str] = None,
+    condition: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Get stored analyses newest-first, paginated with next_cursor"""
+    return await run_in_threadpool(analysis_store.history, patient_id, condition, cursor, limit)
+
+@app.get("/api/history/{analysis_id}")
+async def get_analysis(analysis_id: str):
+    """Get one stored analysis"""
+    record = await run_in_threadpool(analysis_store.get, analysis_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Analysis '{analysis_id}' not found")
+    return record
+
+@app.get("/api/history-stats")
+async def get_history_stats():
+    """Get background writer counters for the analysis store"""
+    return analysis_store.stats()
+
 @app.get("/api/model-info", response_model=ModelInfoResponse)
 async def get_model_info():
     """Get information about the loaded model"""
@@ -186,9 +882,25 @@ async def get_model_info():
         model_type="Classification Model",
         num_classes=len(class_names),
         class_names=class_names,
-        device=str(device)
+        device=str(device),
+        profiles=[
+            {
+                "name": name,
+                "image_size": profile['image_size'],
+                "checkpoint": os.path.basename(profile['checkpoint']),
+                "max_inflight": profile['max_inflight'],
+                "metrics": profile['metrics'],
+            }
+            for name, profile in profiles.items()
+        ],
+        runtime={key: value for key, value in runtime_config.items() if key != 'results'} if runtime_config else None
     )
 
+# Everything above runs at import time; the heavy modules load later in load_in_background()
+startup_timings['app_import_ms'] = round((time.perf_counter() - STARTED_AT) * 1000, 1)
+
 if __name__ == "__main__":
     import uvicorn
+    # One process: sessions, caches and the shadow evaluator live in it (see runtime_tuner.SERVING_WORKERS),
+    # and the runtime sweep runs in the background loader so /api/health answers straight away
     uvicorn.run(app, host="0.0.0.0", port=5000) 
\ No newline at end of file
@@ -0,0 +1,317 @@
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from model_loader import (
+    DEFAULT_CLASSIFIER_PATH, NORMALIZE_MEAN, NORMALIZE_STD,
+    load_classifier, read_architecture, checkpoint_version
+)
+from runtime_tuner import detect_cpu_topology
+from image_guard import open_image
+
+class_names = ['Acne', 'Actinic Keratosis', 'Basal Cell Carcinoma', 'Eczemaa', 'Rosacea']
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+def list_images(inputs: List[str], file_lists: List[str]) -> List[str]:
+    """Image paths from directories (walked recursively), single files and text file lists"""
+    paths = []
+    for file_list in file_lists:
+        with open(file_list) as f:
+            paths.extend(line.strip() for line in f if line.strip())
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, files in os.walk(entry):
+                paths.extend(
+                    os.path.join(root, name) for name in files
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+                )
+        else:
+            paths.append(entry)
+    # Sorted order makes "first N done" a valid resume point
+    return sorted(set(paths))
+
+def decode_image_file(path: str, image_size: int) -> Tuple[str, Optional[np.ndarray], Optional[str]]:
+    """Worker process: decode and resize one image to uint8 HWC, exactly as app.py's transform does"""
+    try:
+        with open(path, 'rb') as f:
+            image = open_image(f.read(), (image_size, image_size)).convert('RGB')
+        image = transforms.Resize((image_size, image_size))(image)
+        return path, np.asarray(image, dtype=np.uint8), None
+    except Exception as e:
+        return path, None, getattr(e, 'detail', None) or str(e) or type(e).__name__
+
+class ResultWriter:
+    """Append-only CSV or JSONL output that can be truncated back to a checkpointed offset"""
+
+    def __init__(self, path: str, fmt: str, offset: Optional[int] = None):
+        self.path = path
+        self.fmt = fmt
+        exists = offset is not None and os.path.exists(path)
+        self.file = open(path, 'r+' if exists else 'w', newline='')
+        if exists:
+            # Drop rows written after the last checkpoint; they are classified again
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        self.csv = csv.writer(self.file) if fmt == 'csv' else None
+        if self.csv and not exists:
+            self.csv.writerow(['path', 'primary_condition', 'confidence', *class_names, 'model_version', 'error'])
+
+    def write(self, rows: List[Dict]):
+        for row in rows:
+            if self.csv:
+                probabilities = row['predictions'] or {}
+                self.csv.writerow([
+                    row['path'], row['primary_condition'] or '', row['confidence'] if row['confidence'] is not None else '',
+                    *[probabilities.get(name, '') for name in class_names],
+                    row['model_version'], row['error'] or ''
+                ])
+            else:
+                self.file.write(json.dumps(row) + '\n')
+
+    def commit(self) -> Dict:
+        """Flush to disk and return the resume position"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'offset': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Parquet output as a directory of part files, one per commit, so resuming never rewrites a file"""
+
+    def __init__(self, path: str, parts: Optional[int] = None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = parts or 0
+        # Remove parts written after the last checkpoint
+        for name in os.listdir(path):
+            if name.startswith('part-') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(path, name))
+        self.pending = []
+
+    def write(self, rows: List[Dict]):
+        self.pending.extend(rows)
+
+    def commit(self) -> Dict:
+        if self.pending:
+            columns = {
+                'path': [row['path'] for row in self.pending],
+                'primary_condition': [row['primary_condition'] for row in self.pending],
+                'confidence': [row['confidence'] for row in self.pending],
+            }
+            for name in class_names:
+                columns[name] = [row['predictions'][name] if row['predictions'] else None for row in self.pending]
+            columns['model_version'] = [row['model_version'] for row in self.pending]
+            columns['error'] = [row['error'] for row in self.pending]
+            self.pq.write_table(self.pa.table(columns), os.path.join(self.path, f"part-{self.parts:05d}.parquet"))
+            self.parts += 1
+            self.pending = []
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+def checkpoint_path(output: str) -> str:
+    return output.rstrip('/') + '.checkpoint.json'
+
+def read_checkpoint(output: str, input_digest: str, model_version: str) -> Optional[Dict]:
+    """The saved resume position, if it belongs to this exact input list and model"""
+    path = checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['input_digest'] != input_digest or checkpoint['model_version'] != model_version:
+        raise SystemExit(f"{path} was written for a different input list or model; remove it or choose another --output")
+    return checkpoint
+
+def write_checkpoint(output: str, checkpoint: Dict):
+    """Atomically replace the checkpoint so a crash never leaves it half-written"""
+    path = checkpoint_path(output)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def prefetch_batches(paths: List[str], image_size: int, batch_size: int, workers: int,
+                     batches: queue.Queue, stop: threading.Event):
+    """Producer thread: decode in a process pool and hand ordered batches to a bounded queue
+
+    At most `batches.maxsize` decoded batches wait for the model and two batches' worth of
+    decodes are in flight, so memory stays bounded however far decoding runs ahead.
+    The queue always ends with None, or with the exception that stopped the producer
+    (e.g. BrokenProcessPool when a decode worker dies) for the consumer to re-raise.
+    """
+    end = None
+    try:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = deque()
+            next_index = 0
+            batch = []
+            while (pending or next_index < len(paths)) and not stop.is_set():
+                while next_index < len(paths) and len(pending) < batch_size * 2:
+                    pending.append(pool.submit(decode_image_file, paths[next_index], image_size))
+                    next_index += 1
+                batch.append(pending.popleft().result())
+                if len(batch) == batch_size or not (pending or next_index < len(paths)):
+                    while not stop.is_set():
+                        try:
+                            batches.put(batch, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+                    batch = []
+            for future in pending:
+                future.cancel()
+    except BaseException as e:
+        end = e
+    finally:
+        batches.put(end)
+
+def classify_batch(model, batch: List[Tuple], model_version: str, device) -> List[Dict]:
+    """Normalize the decoded uint8 images in one go and run them through the model together"""
+    rows = [
+        {'path': path, 'primary_condition': None, 'confidence': None, 'predictions': None,
+         'model_version': model_version, 'error': error}
+        for path, _, error in batch
+    ]
+    decoded = [(i, array) for i, (_, array, _) in enumerate(batch) if array is not None]
+    if decoded:
+        images = torch.from_numpy(np.stack([array for _, array in decoded])).permute(0, 3, 1, 2).float().div_(255)
+        images = transforms.Normalize(mean=NORMALIZE_MEAN, std=NORMALIZE_STD)(images).to(device)
+        with torch.no_grad():
+            probabilities = torch.softmax(model(images), dim=1).cpu().numpy()
+        for (i, _), row_probabilities in zip(decoded, probabilities):
+            rows[i]['predictions'] = {name: float(p) for name, p in zip(class_names, row_probabilities)}
+            rows[i]['primary_condition'] = class_names[int(np.argmax(row_probabilities))]
+            rows[i]['confidence'] = float(np.max(row_probabilities))
+    return rows
+
+def print_progress(done: int, total: int, errors: int, start: float, processed: int):
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    rate = processed / elapsed
+    eta = (total - done) / rate if rate else 0
+    print(f"\r{done}/{total} images ({done / max(total, 1):.1%})  {rate:6.1f} img/s  "
+          f"{errors} errors  ETA {eta // 60:.0f}m{eta % 60:02.0f}s", end='', flush=True)
+
+def main():
+    available = detect_cpu_topology()['available_cpus']
+    default_workers = min(4, max(1, available // 2))
+
+    parser = argparse.ArgumentParser(description="Classify directories of images offline, without the API server")
+    parser.add_argument('inputs', nargs='*', help="Image files or directories (searched recursively)")
+    parser.add_argument('--file-list', action='append', default=[], help="Text file with one image path per line")
+    parser.add_argument('--output', required=True, help="Output file (.csv/.jsonl) or directory (.parquet)")
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help="Defaults to the output extension")
+    parser.add_argument('--checkpoint', default=os.environ.get('DISEASE_CLASSIFIER_PATH', DEFAULT_CLASSIFIER_PATH))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=default_workers, help="Decode processes")
+    parser.add_argument('--threads', type=int, default=max(1, available - default_workers), help="Torch threads")
+    parser.add_argument('--prefetch', type=int, default=4, help="Decoded batches allowed to wait for the model")
+    parser.add_argument('--commit-every', type=int, default=10, help="Batches between output flushes/checkpoints")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.output.rstrip('/'))[1].lstrip('.').lower()
+    if fmt not in ('csv', 'jsonl', 'parquet'):
+        parser.error("Cannot infer the output format; pass --format csv|jsonl|parquet")
+
+    paths = list_images(args.inputs, args.file_list)
+    if not paths:
+        parser.error("No images found")
+    input_digest = hashlib.sha256('\n'.join(paths).encode()).hexdigest()
+
+    torch.set_num_threads(args.threads)
+    device = torch.device("cpu")
+    model = load_classifier(args.checkpoint, len(class_names), device)
+    model_version = checkpoint_version(args.checkpoint)
+    image_size = read_architecture(args.checkpoint)['image_size']
+
+    if args.restart and os.path.exists(checkpoint_path(args.output)):
+        # The output is rewritten from scratch, so a stale checkpoint must not outlive it
+        os.remove(checkpoint_path(args.output))
+    checkpoint = None if args.restart else read_checkpoint(args.output, input_digest, model_version)
+    done = checkpoint['done'] if checkpoint else 0
+    errors = checkpoint['errors'] if checkpoint else 0
+    if fmt == 'parquet':
+        writer = ParquetWriter(args.output, checkpoint['parts'] if checkpoint else None)
+    else:
+        writer = ResultWriter(args.output, fmt, checkpoint['offset'] if checkpoint else None)
+    if done:
+        print(f"Resuming after {done} of {len(paths)} images")
+
+    print(f"Classifying {len(paths) - done} images with {model_version} at {image_size}px "
+          f"({args.workers} decode workers, {args.threads} torch threads, batch {args.batch_size})")
+
+    batches = queue.Queue(maxsize=args.prefetch)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=prefetch_batches,
+        args=(paths[done:], image_size, args.batch_size, args.workers, batches, stop),
+        daemon=True
+    )
+    producer.start()
+
+    start = time.perf_counter()
+    processed = 0
+    uncommitted = 0
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            if isinstance(batch, BaseException):
+                # Decoding failed; rows up to the last checkpoint are kept for a resumed run
+                writer.close()
+                raise batch
+            rows = classify_batch(model, batch, model_version, device)
+            writer.write(rows)
+            done += len(rows)
+            processed += len(rows)
+            errors += sum(1 for row in rows if row['error'])
+            uncommitted += 1
+            if uncommitted >= args.commit_every:
+                write_checkpoint(args.output, {
+                    'input_digest': input_digest, 'model_version': model_version,
+                    'done': done, 'errors': errors, **writer.commit()
+                })
+                uncommitted = 0
+            print_progress(done, len(paths), errors, start, processed)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume from the last checkpoint")
+        stop.set()
+        writer.close()
+        sys.exit(130)
+
+    write_checkpoint(args.output, {
+        'input_digest': input_digest, 'model_version': model_version,
+        'done': done, 'errors': errors, **writer.commit()
+    })
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"\nDone: {processed} images in {elapsed:.1f}s ({processed / max(elapsed, 1e-6):.1f} img/s), "
+          f"{errors} errors. Results in {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import io
+import time
+import base64
+import argparse
+from PIL import Image
+from report_generator import MedicalReportGenerator
+
+def sample_request():
+    """A typical report request: 5 predictions, 3 recommendations, 2 products"""
+    image = Image.new('RGB', (640, 480), color=(200, 120, 110))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    image_data = f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+    analysis_data = {
+        "predictions": {
+            "Acne": 0.82, "Actinic Keratosis": 0.03, "Basal Cell Carcinoma": 0.02,
+            "Eczemaa": 0.08, "Rosacea": 0.05
+        },
+        "primary_condition": "Acne",
+        "confidence": 0.82,
+        "recommendations": [
+            "Use a gentle cleanser twice daily",
+            "Apply appropriate treatment as recommended",
+            "Consult with a dermatologist for severe cases"
+        ],
+        "products": [
+            {"name": "Gentle Cleanser", "brand": "CeraVe", "rating": 4.7, "price": "$14.99"},
+            {"name": "Moisturizer", "brand": "Neutrogena", "rating": 4.6, "price": "$16.99"}
+        ]
+    }
+    return analysis_data, image_data
+
+def time_engine(generator: MedicalReportGenerator, engine: str, runs: int) -> tuple:
+    """Return (ms per report, last PDF) for one engine"""
+    analysis_data, image_data = sample_request()
+    pdf_bytes = generator.create_report(analysis_data, image_data, engine=engine)  # warm-up
+
+    start = time.process_time()
+    for _ in range(runs):
+        pdf_bytes = generator.create_report(analysis_data, image_data, engine=engine)
+    cpu_ms = (time.process_time() - start) * 1000 / runs
+    return cpu_ms, pdf_bytes
+
+def main():
+    """Compare CPU time per report between the platypus and canvas engines"""
+    parser = argparse.ArgumentParser(description="Benchmark the report rendering engines")
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--save', action='store_true', help="Write both PDFs for visual comparison")
+    args = parser.parse_args()
+
+    generator = MedicalReportGenerator()
+    results = {}
+    for engine in ('platypus', 'canvas'):
+        cpu_ms, pdf_bytes = time_engine(generator, engine, args.runs)
+        results[engine] = cpu_ms
+        print(f"{engine:<10} {cpu_ms:8.2f} ms CPU/report  ({len(pdf_bytes)} bytes)")
+        if args.save:
+            filename = f"benchmark_report_{engine}.pdf"
+            with open(filename, 'wb') as f:
+                f.write(pdf_bytes)
+            print(f"           saved {filename}")
+
+    print(f"Canvas engine uses {results['canvas'] / results['platypus']:.0%} of the platypus CPU time")
+
+if __name__ == "__main__":
+    main()
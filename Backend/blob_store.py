@@ -0,0 +1,210 @@
+import io
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from image_guard import open_image
+
+BLOB_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Reports show the image at most 4 inches wide; 300 DPI of that is all a thumbnail needs
+THUMBNAIL_SIZE = 1200
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+
+class BlobStore:
+    """Content-addressed image store: each image is kept once, under its SHA-256
+
+    The id is the same hash the analysis history records as image_hash. Files live in
+    root/ab/cd/<id> with a report-resolution JPEG thumbnail beside them, rendered once on
+    ingest. When the store grows past `max_bytes` the least recently used blobs are deleted.
+
+    Several server workers may share one root, so disk is the source of truth: the in-memory
+    index is only a cache that picks up blobs other processes stored on a miss, and each new
+    blob rescans the directory so eviction sees the total on disk. Recency is the file
+    modification time, which every access refreshes.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 2 * 1024 * 1024 * 1024, thumbnail_size: int = THUMBNAIL_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self._lock = threading.Lock()
+        self._blobs = OrderedDict()  # blob_id -> bytes on disk (image + thumbnail), least recent first
+        self.total_bytes = 0
+        self.stored = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+
+    def _size_on_disk(self, blob_id: str) -> int:
+        path = self.path(blob_id)
+        size = os.path.getsize(path)
+        if os.path.exists(path + THUMBNAIL_SUFFIX):
+            size += os.path.getsize(path + THUMBNAIL_SUFFIX)
+        return size
+
+    def _scan(self):
+        """Rebuild the index from disk, least recently used first; call with the lock held (or from __init__)"""
+        found = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if BLOB_ID_PATTERN.match(name):
+                    try:
+                        found.append((os.path.getmtime(os.path.join(directory, name)), name, self._size_on_disk(name)))
+                    except FileNotFoundError:
+                        # Evicted by another worker during the walk
+                        continue
+        self._blobs = OrderedDict()
+        self.total_bytes = 0
+        for _, blob_id, size in sorted(found):
+            self._blobs[blob_id] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def blob_id(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def path(self, blob_id: str) -> str:
+        if not BLOB_ID_PATTERN.match(blob_id):
+            raise ValueError(f"Invalid blob id '{blob_id}': expected a lowercase SHA-256 hex digest")
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    def thumbnail_path(self, blob_id: str) -> str:
+        return self.path(blob_id) + THUMBNAIL_SUFFIX
+
+    def render_thumbnail(self, image_bytes: bytes) -> Tuple[bytes, int, int]:
+        """JPEG no larger than thumbnail_size on either side; returns (bytes, width, height)"""
+        size = (self.thumbnail_size, self.thumbnail_size)
+        image = open_image(image_bytes, size).convert('RGB')
+        image.thumbnail(size)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue(), image.width, image.height
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        # Write beside the target and rename so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _touch(self, blob_id: str):
+        self._blobs.move_to_end(blob_id)
+        try:
+            os.utime(self.path(blob_id))
+        except FileNotFoundError:
+            pass
+
+    def put(self, image_bytes: bytes) -> Tuple[str, bool]:
+        """Store validated image bytes; returns (blob_id, created) where created is False for a repeat"""
+        blob_id = self.blob_id(image_bytes)
+        with self._lock:
+            if self._sync(blob_id):
+                self._touch(blob_id)
+                self.deduplicated += 1
+                return blob_id, False
+
+        # Render and write outside the lock; the image file lands last and marks the blob complete
+        thumbnail, _, _ = self.render_thumbnail(image_bytes)
+        self._write(self.thumbnail_path(blob_id), thumbnail)
+        self._write(self.path(blob_id), image_bytes)
+
+        with self._lock:
+            if blob_id in self._blobs:
+                # Another request stored the same image meanwhile; the files are identical
+                self.deduplicated += 1
+                return blob_id, False
+            # The other workers' blobs count against max_bytes too, so evict from a fresh scan
+            self._scan()
+            self.stored += 1
+            self._evict(keep=blob_id)
+        return blob_id, True
+
+    def _evict(self, keep: str):
+        while self.total_bytes > self.max_bytes and len(self._blobs) > 1:
+            blob_id, size = next(iter(self._blobs.items()))
+            if blob_id == keep:
+                break
+            del self._blobs[blob_id]
+            self.total_bytes -= size
+            self.evicted += 1
+            for path in (self.path(blob_id), self.thumbnail_path(blob_id)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _sync(self, blob_id: str) -> bool:
+        """Reconcile one index entry with disk; must be called with the lock held"""
+        on_disk = os.path.exists(self.path(blob_id))
+        if blob_id in self._blobs and not on_disk:
+            # Evicted by another worker
+            self.total_bytes -= self._blobs.pop(blob_id)
+        elif blob_id not in self._blobs and on_disk:
+            # Stored by another worker
+            try:
+                self._blobs[blob_id] = self._size_on_disk(blob_id)
+            except FileNotFoundError:
+                return False
+            self.total_bytes += self._blobs[blob_id]
+        return on_disk
+
+    def _lookup(self, blob_id: str) -> bool:
+        self.path(blob_id)
+        with self._lock:
+            if not self._sync(blob_id):
+                self.misses += 1
+                return False
+            self._touch(blob_id)
+            self.hits += 1
+            return True
+
+    def get(self, blob_id: str) -> Optional[bytes]:
+        """Image bytes of a stored blob, or None if it was never stored or has been evicted"""
+        if not self._lookup(blob_id):
+            return None
+        try:
+            with open(self.path(blob_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted between the lookup and the read
+            return None
+
+    def thumbnail(self, blob_id: str) -> Optional[str]:
+        """Path of the report-resolution thumbnail of a stored blob, or None"""
+        if not self._lookup(blob_id):
+            return None
+        path = self.thumbnail_path(blob_id)
+        return path if os.path.exists(path) else None
+
+    def info(self, blob_id: str) -> Optional[Dict]:
+        """Disk usage (image plus thumbnail) of a stored blob, without refreshing its LRU position"""
+        self.path(blob_id)
+        with self._lock:
+            size = self._blobs.get(blob_id) if self._sync(blob_id) else None
+        return {'blob_id': blob_id, 'stored_bytes': size} if size is not None else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'root': self.root,
+                'blobs': len(self._blobs),
+                'stored_mb': round(self.total_bytes / (1024 * 1024), 1),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'stored': self.stored,
+                'deduplicated': self.deduplicated,
+                'evicted': self.evicted,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,88 @@
+import threading
+import time
+from typing import Callable, Dict, Tuple
+import torch
+import numpy as np
+from PIL import Image
+from model_loader import load_classifier, read_architecture, eval_transform, checkpoint_version
+
+class ModelCascade:
+    """Two-stage cascade: a cheap model answers confident cases, the rest escalate to the full model"""
+
+    # Width of the fast-stage confidence histogram buckets, used to estimate other thresholds offline
+    HISTOGRAM_BUCKETS = 20
+
+    def __init__(self, checkpoint_path: str, num_classes: int, device: torch.device, threshold: float = 0.9):
+        self.checkpoint_path = checkpoint_path
+        self.device = device
+        self.threshold = threshold
+        self.model = load_classifier(checkpoint_path, num_classes, device)
+        self.version = checkpoint_version(checkpoint_path)
+        self.image_size = read_architecture(checkpoint_path)['image_size']
+        self.transform = eval_transform(self.image_size)
+
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Clear the escalation and latency counters"""
+        with self._lock:
+            self.total = 0
+            self.answered_fast = 0
+            self.escalated = 0
+            self.fast_latency_ms = 0.0
+            self.escalated_latency_ms = 0.0
+            self.confidence_histogram = [0] * self.HISTOGRAM_BUCKETS
+
+    def fast_probabilities(self, image: Image.Image) -> np.ndarray:
+        """Run the first-stage model on a decoded image"""
+        image_tensor = self.transform(image).unsqueeze(0).to(self.device)
+        with torch.no_grad():
+            outputs = self.model(image_tensor)
+            return torch.softmax(outputs, dim=1)[0].cpu().numpy()
+
+    def classify(self, image: Image.Image, full_model: Callable[[Image.Image], np.ndarray]) -> Tuple[np.ndarray, str]:
+        """Return (probabilities, stage) where stage is "fast" or "full" """
+        start = time.perf_counter()
+        probabilities = self.fast_probabilities(image)
+        confidence = float(np.max(probabilities))
+
+        stage = "fast"
+        if confidence < self.threshold:
+            probabilities = full_model(image)
+            stage = "full"
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        bucket = min(int(confidence * self.HISTOGRAM_BUCKETS), self.HISTOGRAM_BUCKETS - 1)
+
+        with self._lock:
+            self.total += 1
+            self.confidence_histogram[bucket] += 1
+            if stage == "fast":
+                self.answered_fast += 1
+                self.fast_latency_ms += elapsed_ms
+            else:
+                self.escalated += 1
+                self.escalated_latency_ms += elapsed_ms
+
+        return probabilities, stage
+
+    def stats(self) -> Dict:
+        """Escalation rate and per-path average latency for threshold tuning"""
+        with self._lock:
+            total_latency = self.fast_latency_ms + self.escalated_latency_ms
+            return {
+                'checkpoint': self.checkpoint_path,
+                'image_size': self.image_size,
+                'threshold': self.threshold,
+                'total_requests': self.total,
+                'answered_fast': self.answered_fast,
+                'escalated': self.escalated,
+                'escalation_rate': self.escalated / self.total if self.total else 0.0,
+                'avg_latency_ms': total_latency / self.total if self.total else 0.0,
+                'avg_fast_latency_ms': self.fast_latency_ms / self.answered_fast if self.answered_fast else 0.0,
+                'avg_escalated_latency_ms': self.escalated_latency_ms / self.escalated if self.escalated else 0.0,
+                # Counts of fast-stage max probability in [i/N, (i+1)/N); the escalation rate for any
+                # candidate threshold is the share of requests in the buckets below it
+                'confidence_histogram': list(self.confidence_histogram),
+            }
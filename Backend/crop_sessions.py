@@ -0,0 +1,125 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+
+class CropSession:
+    """A decoded upload kept server-side so crops can be taken without re-sending it"""
+    __slots__ = ('session_id', 'image', 'image_hash', 'created_at', 'last_used', 'crops_classified')
+
+    def __init__(self, session_id: str, image: Image.Image, image_hash: str):
+        self.session_id = session_id
+        self.image = image
+        self.image_hash = image_hash
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.crops_classified = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self.image.width * self.image.height * len(self.image.getbands())
+
+class CropSessionStore:
+    """Bounded LRU of decoded images with a sliding TTL
+
+    Sessions expire `ttl_seconds` after their last use, and the least recently used ones
+    are evicted whenever the decoded pixels exceed `max_bytes` or there are more than
+    `max_sessions`. Every access runs under one lock; the work done there is dictionary
+    bookkeeping only, and cropping happens on the caller's thread.
+    """
+
+    def __init__(self, max_sessions: int = 64, max_bytes: int = 512 * 1024 * 1024, ttl_seconds: float = 600):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.crops_classified = 0
+
+    def _remove(self, session_id: str) -> CropSession:
+        session = self._sessions.pop(session_id)
+        self.total_bytes -= session.size_bytes
+        return session
+
+    def _expire(self, now: float):
+        # Oldest-used sessions sit at the front, so stop at the first live one
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl_seconds:
+                break
+            self._remove(session.session_id)
+            self.expired += 1
+
+    def create(self, image: Image.Image, image_hash: str) -> CropSession:
+        """Keep a decoded image and return its new session"""
+        session = CropSession(uuid.uuid4().hex, image, image_hash)
+        if session.size_bytes > self.max_bytes:
+            raise ValueError("Image is too large to keep in a crop session")
+
+        with self._lock:
+            self._expire(time.monotonic())
+            self._sessions[session.session_id] = session
+            self.total_bytes += session.size_bytes
+            self.created += 1
+            while len(self._sessions) > self.max_sessions or self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._sessions)))
+                self.evicted += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[CropSession]:
+        """Look up a live session and extend its TTL"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def record_crops(self, session: CropSession, count: int):
+        with self._lock:
+            session.crops_classified += count
+            self.crops_classified += count
+
+    def expires_in(self, session: CropSession) -> float:
+        return max(self.ttl_seconds - (time.monotonic() - session.last_used), 0.0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'cached_mb': round(self.total_bytes / (1024 * 1024), 1),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'ttl_seconds': self.ttl_seconds,
+                'created': self.created,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'crops_classified': self.crops_classified,
+            }
+
+def crop_images(image: Image.Image, crops: List[Tuple[int, int, int, int]]) -> List[Image.Image]:
+    """Cut (x, y, width, height) rectangles out of the cached image; empty means the whole image"""
+    if not crops:
+        return [image]
+    boxes = []
+    for x, y, width, height in crops:
+        if width <= 0 or height <= 0 or x < 0 or y < 0 or x + width > image.width or y + height > image.height:
+            raise ValueError(f"Crop ({x}, {y}, {width}, {height}) is outside the {image.width}x{image.height} image")
+        boxes.append((x, y, x + width, y + height))
+    return [image.crop(box) for box in boxes]
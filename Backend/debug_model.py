@@ -1,10 +1,10 @@
 import os
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
 from PIL import Image
 import numpy as np
 from efficientnet_pytorch import EfficientNet
+from model_loader import eval_transform
 
 # Global variables for model and device
 model = None
@@ -63,17 +63,13 @@ def load_model():
     model.eval()
     print("Model loaded successfully!")
 
-def preprocess_image(image_path: str) -> torch.Tensor:
+def preprocess_image(image_path: str, image_size: int = 224) -> torch.Tensor:
     """Preprocess the image to match the training pipeline"""
     # Open image with PIL
     image = Image.open(image_path).convert('RGB')
     
     # Apply the same transformations as in the notebook
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+    transform = eval_transform(image_size)
     
     # Apply transformations and add batch dimension
     image_tensor = transform(image).unsqueeze(0)
@@ -0,0 +1,282 @@
+import io
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from model_loader import DATA_DIR
+from image_guard import open_image
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+# Orthonormal DCT-II basis for the 32x32 pHash input; dct2(X) = D @ X @ D.T
+HASH_INPUT_SIZE = 32
+_k = np.arange(HASH_INPUT_SIZE)
+DCT_MATRIX = np.sqrt(2 / HASH_INPUT_SIZE) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * HASH_INPUT_SIZE))
+DCT_MATRIX[0] /= np.sqrt(2)
+
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Set bits per uint64 (numpy < 2.0 has no bitwise_count)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def list_dataset(data_dir: str) -> List[Tuple[str, str, str]]:
+    """(split, label, relative path) for every image in <data_dir>/<split>/<label>/"""
+    entries = []
+    for split in sorted(os.listdir(data_dir)):
+        split_dir = os.path.join(data_dir, split)
+        if not os.path.isdir(split_dir):
+            continue
+        for label in sorted(os.listdir(split_dir)):
+            label_dir = os.path.join(split_dir, label)
+            if not os.path.isdir(label_dir):
+                continue
+            for root, _, files in os.walk(label_dir):
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        entries.append((split, label, os.path.relpath(os.path.join(root, name), data_dir)))
+    return entries
+
+def phash_file(path: str) -> Tuple[int, int, Optional[str]]:
+    """Worker: (64-bit DCT perceptual hash, pixel count, error) of one image"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Full resolution from the header, without the API's upload caps (dataset images may be large);
+        # JPEGs then decode at 1/8 scale since the hash only needs 32x32
+        with Image.open(io.BytesIO(data)) as header:
+            pixels = header.width * header.height
+        image = open_image(data, (HASH_INPUT_SIZE, HASH_INPUT_SIZE))
+        gray = np.asarray(image.convert('L').resize((HASH_INPUT_SIZE, HASH_INPUT_SIZE), Image.BILINEAR), dtype=np.float64)
+        # Lowest 8x8 frequencies, thresholded at their median (DC term excluded from the median)
+        low = (DCT_MATRIX @ gray @ DCT_MATRIX.T)[:8, :8].flatten()
+        bits = low > np.median(low[1:])
+        return int(np.packbits(bits).view('>u8')[0]), pixels, None
+    except Exception as e:
+        return 0, 0, getattr(e, 'detail', None) or str(e) or type(e).__name__
+
+def compute_hashes(paths: List[str], workers: int) -> Tuple[np.ndarray, np.ndarray, List[Optional[str]]]:
+    """Hash every image in a process pool, with a progress line"""
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    pixels = np.zeros(len(paths), dtype=np.int64)
+    errors = [None] * len(paths)
+    start = time.perf_counter()
+    chunksize = max(1, min(256, len(paths) // (workers * 16) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, (value, size, error) in enumerate(pool.map(phash_file, paths, chunksize=chunksize)):
+            hashes[i], pixels[i], errors[i] = value, size, error
+            if (i + 1) % 1000 == 0 or i + 1 == len(paths):
+                rate = (i + 1) / max(time.perf_counter() - start, 1e-6)
+                print(f"\rHashed {i + 1}/{len(paths)} images ({rate:.0f} img/s)", end='', flush=True)
+    print()
+    return hashes, pixels, errors
+
+def _chunk_neighbors(bits: int, radius: int) -> List[int]:
+    """XOR masks of every value within `radius` bit flips inside a chunk"""
+    masks = [0]
+    for _ in range(radius):
+        masks = sorted({mask | (1 << bit) for mask in masks for bit in range(bits)} | set(masks))
+    return masks
+
+def near_duplicate_pairs(hashes: np.ndarray, max_distance: int, chunks: int = 4) -> np.ndarray:
+    """All (i, j), i < j, with Hamming distance <= max_distance, via multi-index hashing
+
+    The 64 bits are split into `chunks` substrings. By pigeonhole, two hashes within
+    distance r agree to within floor(r / chunks) bits on at least one substring, so each
+    substring table is probed only at that small radius. Candidates come from sorted
+    substring keys and searchsorted joins, then are verified with an exact popcount,
+    with no all-pairs comparison.
+    """
+    n = len(hashes)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    # Substring widths cover all 64 bits even when chunks does not divide 64
+    widths = [64 // chunks + (1 if chunk < 64 % chunks else 0) for chunk in range(chunks)]
+    sub_radius = max_distance // chunks
+    found = []
+
+    shift = 0
+    for bits in widths:
+        keys = (hashes >> np.uint64(shift)) & np.uint64((1 << bits) - 1)
+        shift += bits
+        masks = np.array(_chunk_neighbors(bits, sub_radius), dtype=np.uint64)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        for mask in masks:
+            probes = keys ^ mask
+            lo = np.searchsorted(sorted_keys, probes, side='left')
+            hi = np.searchsorted(sorted_keys, probes, side='right')
+            counts = hi - lo
+            if not counts.any():
+                continue
+            # Expand each query's [lo, hi) bucket range into explicit (query, candidate) pairs
+            queries = np.repeat(np.arange(n), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            candidates = order[np.repeat(lo, counts) + offsets]
+            keep = queries < candidates
+            queries, candidates = queries[keep], candidates[keep]
+            close = popcount64(hashes[queries] ^ hashes[candidates]) <= max_distance
+            if close.any():
+                found.append(np.stack([queries[close], candidates[close]], axis=1))
+
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(found), axis=0)
+
+def cluster(n: int, pairs: np.ndarray) -> np.ndarray:
+    """Union-find over the pairs; returns a root index per item"""
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    return np.array([find(i) for i in range(n)])
+
+def plan_removals(entries: List[Tuple[str, str, str]], pixels: np.ndarray, roots: np.ndarray,
+                  protected_split: str, drop_label_conflicts: bool = False) -> Tuple[Dict[int, str], List[Dict]]:
+    """Decide which copies to drop: cross-split leaks leave the protected split, then one copy per split
+
+    `roots` holds a cluster label per image. Returns ({index: reason} for dropped images, cluster descriptions).
+    """
+    members_by_root = {}
+    for i, root in enumerate(roots):
+        members_by_root.setdefault(int(root), []).append(i)
+
+    dropped = {}
+    clusters = []
+    for members in members_by_root.values():
+        if len(members) < 2:
+            continue
+        splits = {entries[i][0] for i in members}
+        labels = {entries[i][1] for i in members}
+
+        survivors = members
+        if drop_label_conflicts and len(labels) > 1:
+            for i in members:
+                dropped[i] = 'label_conflict'
+            survivors = []
+        elif protected_split in splits and len(splits) > 1:
+            # The held-out copy stays so the test set is unchanged; training copies leak it
+            for i in members:
+                if entries[i][0] != protected_split:
+                    dropped[i] = f'leaks_into_{protected_split}'
+            survivors = [i for i in members if entries[i][0] == protected_split]
+
+        # Within a split keep the highest-resolution copy
+        by_split = {}
+        for i in survivors:
+            by_split.setdefault(entries[i][0], []).append(i)
+        for split_members in by_split.values():
+            keep = max(split_members, key=lambda i: (pixels[i], -len(entries[i][2]), entries[i][2]))
+            for i in split_members:
+                if i != keep:
+                    dropped[i] = 'duplicate_within_split'
+
+        clusters.append({
+            'size': len(members),
+            'splits': sorted(splits),
+            'labels': sorted(labels),
+            'label_conflict': len(labels) > 1,
+            'members': [
+                {'path': entries[i][2], 'split': entries[i][0], 'label': entries[i][1],
+                 'dropped': dropped.get(i)}
+                for i in members
+            ],
+        })
+    clusters.sort(key=lambda c: -c['size'])
+    return dropped, clusters
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images across dataset splits and write a cleaned manifest")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Dataset root containing <split>/<class>/ folders")
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'manifest_dedup.csv'), help="Cleaned manifest (kept images)")
+    parser.add_argument('--report', default=None, help="Cluster report JSON (defaults next to the manifest)")
+    parser.add_argument('--max-distance', type=int, default=6, help="Hamming distance (of 64 bits) counted as a near-duplicate")
+    parser.add_argument('--chunks', type=int, default=4, help="Multi-index hashing substrings")
+    parser.add_argument('--protected-split', default='testing', help="Split whose copies are kept when a duplicate crosses splits")
+    parser.add_argument('--drop-label-conflicts', action='store_true', help="Drop every copy in clusters whose class folders disagree")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    entries = list_dataset(args.data_dir)
+    if not entries:
+        parser.error(f"No images found under {args.data_dir}/<split>/<class>/")
+    print(f"Found {len(entries)} images in {len({e[0] for e in entries})} splits")
+
+    hashes, pixels, errors = compute_hashes([os.path.join(args.data_dir, e[2]) for e in entries], args.workers)
+    valid = np.array([error is None for error in errors])
+
+    # Identical hashes are grouped directly; only the distinct values go through the index
+    valid_indices = np.flatnonzero(valid)
+    unique_hashes, inverse = np.unique(hashes[valid_indices], return_inverse=True)
+    unique_pairs = near_duplicate_pairs(unique_hashes, args.max_distance, args.chunks)
+    unique_roots = cluster(len(unique_hashes), unique_pairs)
+
+    # Cluster label per image; unreadable images get labels of their own
+    roots = np.arange(len(entries)) + len(unique_hashes)
+    roots[valid_indices] = unique_roots[inverse]
+    print(f"Indexed {len(unique_hashes)} distinct hashes, {len(unique_pairs)} near-duplicate hash pairs "
+          f"within distance {args.max_distance}")
+
+    dropped, clusters = plan_removals(entries, pixels, roots, args.protected_split, args.drop_label_conflicts)
+    for i in np.flatnonzero(~valid):
+        dropped[int(i)] = 'unreadable'
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['path', 'split', 'label'])
+        for i, (split, label, path) in enumerate(entries):
+            if i not in dropped:
+                writer.writerow([path, split, label])
+
+    reasons = {}
+    for reason in dropped.values():
+        reasons[reason] = reasons.get(reason, 0) + 1
+    kept_per_split = {}
+    for i, (split, _, _) in enumerate(entries):
+        if i not in dropped:
+            kept_per_split[split] = kept_per_split.get(split, 0) + 1
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'data_dir': os.path.abspath(args.data_dir),
+        'max_distance': args.max_distance,
+        'protected_split': args.protected_split,
+        'images': len(entries),
+        'kept': len(entries) - len(dropped),
+        'kept_per_split': kept_per_split,
+        'dropped': reasons,
+        'clusters': len(clusters),
+        'cross_split_clusters': sum(1 for c in clusters if len(c['splits']) > 1),
+        'label_conflict_clusters': sum(1 for c in clusters if c['label_conflict']),
+        'unreadable': [entries[i][2] for i in np.flatnonzero(~valid)],
+        'cluster_details': clusters,
+    }
+    report_path = args.report or os.path.splitext(args.output)[0] + '_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Kept {report['kept']} of {len(entries)} images {kept_per_split}; dropped {reasons}")
+    print(f"{report['clusters']} duplicate clusters, {report['cross_split_clusters']} crossing splits, "
+          f"{report['label_conflict_clusters']} with conflicting labels")
+    print(f"Manifest written to {args.output}, report to {report_path} ({time.perf_counter() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
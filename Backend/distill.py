@@ -0,0 +1,204 @@
+import os
+import json
+import argparse
+from datetime import datetime
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets
+from model_loader import (
+    DATA_DIR, DEFAULT_CLASSIFIER_PATH, ML_DIR, manifest_filter, measure_latency,
+    build_classifier, load_classifier, save_classifier, read_architecture,
+    eval_transform, train_transform
+)
+
+class_names = ['Acne', 'Actinic Keratosis', 'Basal Cell Carcinoma', 'Eczemaa', 'Rosacea']
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature: float, alpha: float):
+    """Hinton-style KD loss: softened teacher KL term plus hard-label cross entropy"""
+    soft_targets = F.softmax(teacher_logits / temperature, dim=1)
+    soft_student = F.log_softmax(student_logits / temperature, dim=1)
+    # Scale by T^2 so the soft-term gradients keep their magnitude as T changes
+    kd_loss = F.kl_div(soft_student, soft_targets, reduction='batchmean') * (temperature ** 2)
+    ce_loss = F.cross_entropy(student_logits, labels)
+    return alpha * kd_loss + (1 - alpha) * ce_loss
+
+def train_student(student, teacher, train_loader, val_loader, args, device):
+    """Train the student on softened teacher logits, keeping the checkpoint that agrees best on val_loader
+
+    val_loader must not be the split the final report is measured on, or the reported
+    agreement is inflated by the selection.
+    """
+    optimizer = optim.Adam(student.parameters(), lr=args.lr)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='max', factor=0.1, patience=3)
+    best_agreement = -1.0
+
+    for epoch in range(args.epochs):
+        student.train()
+        running_loss = 0.0
+        for images, labels in train_loader:
+            images, labels = images.to(device), labels.to(device)
+            with torch.no_grad():
+                teacher_logits = teacher(images)
+
+            optimizer.zero_grad()
+            student_logits = student(images)
+            loss = distillation_loss(student_logits, teacher_logits, labels, args.temperature, args.alpha)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item()
+
+        metrics = evaluate_pair(teacher, student, val_loader, device)
+        scheduler.step(metrics['top1_agreement'])
+        print(f"Epoch {epoch+1}/{args.epochs}, Loss: {running_loss/len(train_loader):.4f}, "
+              f"Agreement: {metrics['top1_agreement']:.2%}, Student Accuracy: {metrics['student_accuracy']:.2%}")
+
+        if metrics['top1_agreement'] > best_agreement:
+            best_agreement = metrics['top1_agreement']
+            save_classifier(student, args.output, student_architecture(args))
+
+    return best_agreement
+
+def evaluate_pair(teacher, student, loader, device) -> dict:
+    """Compare teacher and student predictions on a held-out loader"""
+    teacher.eval()
+    student.eval()
+    agree = 0
+    teacher_correct = 0
+    student_correct = 0
+    total = 0
+
+    with torch.no_grad():
+        for images, labels in loader:
+            images, labels = images.to(device), labels.to(device)
+            teacher_pred = teacher(images).argmax(dim=1)
+            student_pred = student(images).argmax(dim=1)
+            agree += (teacher_pred == student_pred).sum().item()
+            teacher_correct += (teacher_pred == labels).sum().item()
+            student_correct += (student_pred == labels).sum().item()
+            total += labels.size(0)
+
+    return {
+        'samples': total,
+        'top1_agreement': agree / max(total, 1),
+        'teacher_accuracy': teacher_correct / max(total, 1),
+        'student_accuracy': student_correct / max(total, 1),
+    }
+
+def measure_memory(model, checkpoint_path: str) -> dict:
+    """Parameter count, in-memory weight size and on-disk checkpoint size"""
+    parameters = sum(p.numel() for p in model.parameters())
+    tensor_bytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    return {
+        'parameters': parameters,
+        'weights_mb': tensor_bytes / (1024 * 1024),
+        'checkpoint_mb': os.path.getsize(checkpoint_path) / (1024 * 1024),
+    }
+
+def student_architecture(args) -> dict:
+    """Architecture sidecar written next to the student checkpoint"""
+    return {
+        'model_name': 'efficientnet-b0',
+        'width_coefficient': args.width,
+        'depth_coefficient': args.depth,
+        'image_size': args.image_size,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distill disease_classifier.pth into a lightweight student model")
+    parser.add_argument('--teacher', default=DEFAULT_CLASSIFIER_PATH, help="Teacher checkpoint")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Dataset root containing train/ and testing/")
+    parser.add_argument('--manifest', default=None, help="Cleaned split manifest from dedupe_dataset.py")
+    parser.add_argument('--output', default=os.path.join(ML_DIR, 'disease_classifier_student.pth'), help="Student checkpoint path")
+    parser.add_argument('--width', type=float, default=0.5, help="Student width coefficient (B0 is 1.0)")
+    parser.add_argument('--depth', type=float, default=0.5, help="Student depth coefficient (B0 is 1.0)")
+    parser.add_argument('--image-size', type=int, default=224, help="Student input resolution")
+    parser.add_argument('--temperature', type=float, default=4.0, help="Softmax temperature for the teacher logits")
+    parser.add_argument('--alpha', type=float, default=0.7, help="Weight of the distillation term vs hard labels")
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--val-fraction', type=float, default=0.1,
+                        help="Share of train/ held out to pick the best epoch; testing/ is only used for the report")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the train/validation split")
+    return parser.parse_args()
+
+def main():
+    """Distill the teacher, then write a teacher-vs-student comparison report"""
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    print(f"Loading teacher from {args.teacher}...")
+    teacher = load_classifier(args.teacher, len(class_names), device)
+    teacher_size = read_architecture(args.teacher)['image_size']
+
+    # Both models see the student's resolution during training so the teacher logits match its inputs
+    train_dir = os.path.join(args.data_dir, 'train')
+    train_filter = manifest_filter(args.manifest, args.data_dir, 'train')
+    train_dataset = datasets.ImageFolder(train_dir, transform=train_transform(args.image_size), is_valid_file=train_filter)
+    test_dataset = datasets.ImageFolder(os.path.join(args.data_dir, 'testing'), transform=eval_transform(args.image_size),
+                                        is_valid_file=manifest_filter(args.manifest, args.data_dir, 'testing'))
+    if train_dataset.classes != class_names:
+        raise ValueError(f"Dataset classes {train_dataset.classes} do not match {class_names}")
+
+    # Epochs are selected on a slice of train/ (without augmentation) so testing/ stays unseen until the report
+    order = torch.randperm(len(train_dataset), generator=torch.Generator().manual_seed(args.seed)).tolist()
+    val_count = max(1, int(len(order) * args.val_fraction))
+    val_dataset = datasets.ImageFolder(train_dir, transform=eval_transform(args.image_size), is_valid_file=train_filter)
+
+    train_loader = DataLoader(Subset(train_dataset, order[val_count:]), batch_size=args.batch_size, shuffle=True)
+    val_loader = DataLoader(Subset(val_dataset, order[:val_count]), batch_size=args.batch_size, shuffle=False)
+    test_loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False)
+    print(f"{len(order) - val_count} training images, {val_count} for epoch selection, {len(test_dataset)} held out")
+
+    student = build_classifier(len(class_names), student_architecture(args)).to(device)
+
+    print(f"Distilling into width={args.width}, depth={args.depth}, image_size={args.image_size} student...")
+    train_student(student, teacher, train_loader, val_loader, args, device)
+
+    # Reload the best student exactly as the API would serve it
+    student = load_classifier(args.output, len(class_names), device)
+
+    # Latency is measured on CPU, which is what the API serves on
+    cpu = torch.device("cpu")
+    teacher_cpu = load_classifier(args.teacher, len(class_names), cpu)
+    student_cpu = load_classifier(args.output, len(class_names), cpu)
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'teacher': args.teacher,
+        'student': args.output,
+        'student_architecture': student_architecture(args),
+        'distillation': {'temperature': args.temperature, 'alpha': args.alpha, 'epochs': args.epochs,
+                         'val_fraction': args.val_fraction, 'seed': args.seed},
+        'validation': evaluate_pair(teacher, student, val_loader, device),
+        'held_out': evaluate_pair(teacher, student, test_loader, device),
+        'latency_cpu': {
+            'teacher': measure_latency(teacher_cpu, teacher_size, cpu),
+            'student': measure_latency(student_cpu, args.image_size, cpu),
+        },
+        'memory': {
+            'teacher': measure_memory(teacher_cpu, args.teacher),
+            'student': measure_memory(student_cpu, args.output),
+        },
+    }
+    report['latency_cpu']['speedup'] = report['latency_cpu']['teacher']['median_ms'] / report['latency_cpu']['student']['median_ms']
+
+    report_path = os.path.splitext(args.output)[0] + '_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"Top-1 agreement:   {report['held_out']['top1_agreement']:.2%}")
+    print(f"Teacher accuracy:  {report['held_out']['teacher_accuracy']:.2%}")
+    print(f"Student accuracy:  {report['held_out']['student_accuracy']:.2%}")
+    print(f"Teacher latency:   {report['latency_cpu']['teacher']['median_ms']:.1f} ms")
+    print(f"Student latency:   {report['latency_cpu']['student']['median_ms']:.1f} ms ({report['latency_cpu']['speedup']:.2f}x)")
+    print(f"Teacher weights:   {report['memory']['teacher']['weights_mb']:.1f} MB")
+    print(f"Student weights:   {report['memory']['student']['weights_mb']:.1f} MB")
+    print(f"Report saved to {report_path}")
+    print(f"Serve the student with: DISEASE_CLASSIFIER_PATH={args.output}")
+
+if __name__ == "__main__":
+    main()
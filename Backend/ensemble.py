@@ -0,0 +1,156 @@
+import copy
+import hashlib
+import threading
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+import torch
+from torch.func import functional_call, stack_module_state
+from PIL import Image
+from model_loader import load_classifier, read_architecture, eval_transform, checkpoint_version
+
+class CheckpointEnsemble:
+    """Average several same-architecture checkpoints (e.g. training seeds) in one batched call
+
+    When every member shares the backbone weights and only the classifier heads differ, the
+    backbone runs once and the heads are applied as one stacked matmul. Otherwise the members'
+    parameters are stacked and the network is vmapped over them, so K models cost one call
+    with K-times-wider kernels instead of K sequential forward passes.
+    """
+
+    def __init__(self, checkpoint_paths: List[str], num_classes: int, device: torch.device):
+        if len(checkpoint_paths) < 2:
+            raise ValueError("An ensemble needs at least two checkpoints")
+        architectures = [read_architecture(path) for path in checkpoint_paths]
+        if any(architecture != architectures[0] for architecture in architectures[1:]):
+            raise ValueError("Ensemble checkpoints must share one architecture")
+
+        self.checkpoint_paths = checkpoint_paths
+        self.device = device
+        self.image_size = architectures[0]['image_size']
+        self.transform = eval_transform(self.image_size)
+        self.member_versions = [checkpoint_version(path) for path in checkpoint_paths]
+        digest = hashlib.sha256('|'.join(self.member_versions).encode()).hexdigest()[:12]
+        self.version = f"ensemble-{len(checkpoint_paths)}@{digest}"
+
+        members = [load_classifier(path, num_classes, device) for path in checkpoint_paths]
+        # The memory-efficient swish is a custom autograd.Function without a vmap rule
+        for member in members:
+            member.set_swish(memory_efficient=False)
+
+        if self._shares_backbone(members):
+            self.mode = 'shared_backbone'
+            self.backbone = members[0]
+            self.head_weight = torch.stack([member._fc.weight.detach() for member in members])
+            self.head_bias = torch.stack([member._fc.bias.detach() for member in members])
+        else:
+            self.mode = 'vmap'
+            self.params, self.buffers = stack_module_state(members)
+            # Only the module structure is needed; the weights come from the stacked state
+            self.base = copy.deepcopy(members[0]).to('meta')
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+        self.latency_ms = 0.0
+        self.benchmark = None
+        # Set by measure_latency() when the batched call loses to members one after another
+        self.sequential = False
+
+    @staticmethod
+    def _shares_backbone(members: List[torch.nn.Module]) -> bool:
+        reference = members[0].state_dict()
+        for member in members[1:]:
+            for name, tensor in member.state_dict().items():
+                if not name.startswith('_fc.') and not torch.equal(tensor, reference[name]):
+                    return False
+        return True
+
+    def _member(self, params: Dict, buffers: Dict, image_tensor: torch.Tensor) -> torch.Tensor:
+        return functional_call(self.base, (params, buffers), (image_tensor,))
+
+    def member_logits(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        """Logits of every member for a batch: (members, batch, classes)"""
+        if self.sequential:
+            return torch.stack([self._single_logits(image_tensor, i) for i in range(len(self.checkpoint_paths))])
+        return self._batched_logits(image_tensor)
+
+    def _batched_logits(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            if self.mode == 'shared_backbone':
+                features = self.backbone.extract_features(image_tensor)
+                features = self.backbone._avg_pooling(features).flatten(start_dim=1)
+                return torch.einsum('bf,kcf->kbc', features, self.head_weight) + self.head_bias[:, None, :]
+            return torch.vmap(self._member, in_dims=(0, 0, None))(self.params, self.buffers, image_tensor)
+
+    def predict(self, image_tensor: torch.Tensor) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (averaged probabilities (batch, classes), member probabilities (members, batch, classes))"""
+        start = time.perf_counter()
+        member_probabilities = torch.softmax(self.member_logits(image_tensor), dim=2).cpu().numpy()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.calls += 1
+            self.images += image_tensor.shape[0]
+            self.latency_ms += elapsed_ms
+        return member_probabilities.mean(axis=0), member_probabilities
+
+    def classify(self, image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+        """Averaged and per-member probabilities for one decoded image"""
+        probabilities, member_probabilities = self.predict(self.transform(image).unsqueeze(0).to(self.device))
+        return probabilities[0], member_probabilities[:, 0]
+
+    def _single_logits(self, image_tensor: torch.Tensor, index: int = 0) -> torch.Tensor:
+        """One member on its own, as it would run without the ensemble"""
+        with torch.no_grad():
+            if self.mode == 'shared_backbone':
+                features = self.backbone._avg_pooling(self.backbone.extract_features(image_tensor)).flatten(start_dim=1)
+                return features @ self.head_weight[index].T + self.head_bias[index]
+            params = {name: value[index] for name, value in self.params.items()}
+            buffers = {name: value[index] for name, value in self.buffers.items()}
+            return self._member(params, buffers, image_tensor)
+
+    def measure_latency(self, repeats: int = 5) -> Dict:
+        """Median batch-of-one latency of one member, all members one after another, and the batched ensemble
+
+        Falls back to sequential evaluation when the batched call is the slower of the two.
+        """
+        image_tensor = torch.randn(1, 3, self.image_size, self.image_size, device=self.device)
+
+        def median_ms(fn) -> float:
+            fn()
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                fn()
+                timings.append((time.perf_counter() - start) * 1000)
+            return float(np.median(timings))
+
+        single_ms = median_ms(lambda: self._single_logits(image_tensor))
+        sequential_ms = median_ms(lambda: [self._single_logits(image_tensor, i) for i in range(len(self.checkpoint_paths))])
+        ensemble_ms = median_ms(lambda: self._batched_logits(image_tensor))
+        self.benchmark = {
+            'single_ms': round(single_ms, 2),
+            'sequential_ms': round(sequential_ms, 2),
+            'ensemble_ms': round(ensemble_ms, 2),
+            'cost_vs_single': round(ensemble_ms / single_ms, 2),
+            'cost_vs_sequential': round(ensemble_ms / sequential_ms, 2),
+        }
+        self.sequential = self.benchmark['cost_vs_sequential'] > 1
+        return self.benchmark
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'version': self.version,
+                'mode': self.mode,
+                'sequential': self.sequential,
+                'members': [
+                    {'checkpoint': path, 'version': version}
+                    for path, version in zip(self.checkpoint_paths, self.member_versions)
+                ],
+                'image_size': self.image_size,
+                'calls': self.calls,
+                'images': self.images,
+                'avg_latency_ms': self.latency_ms / self.calls if self.calls else 0.0,
+                'latency_cost': self.benchmark,
+            }
@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageOps
+
+if TYPE_CHECKING:
+    import torch
+
+class GradCAM:
+    """Grad-CAM on the last MBConv block, computed from the classification forward pass itself
+
+    A forward hook detaches the last block's output and marks it as requiring grad, and the
+    model's parameters are frozen, so autograd only records the short head after that block
+    (conv head, pooling, classifier). The top-k class maps then come from one batched backward
+    over that head instead of a second forward plus a full backward per class. Captures are
+    thread-local, so concurrent non-explaining inference on the same model is unaffected.
+
+    The constructor deliberately changes the model it is given, which is the shared serving
+    model: every parameter is frozen and EfficientNet's swish is switched to the plain
+    implementation. Neither changes inference output, since serving never trains and both
+    swish variants compute the same forward. Applying them per explain() call instead would
+    swap modules under concurrent requests.
+
+    torch is imported inside explain() so the report path can use the helpers below without it.
+    """
+
+    def __init__(self, model: 'torch.nn.Module'):
+        self.model = model
+        # Global on purpose (see the class docstring). The server never trains, and frozen
+        # weights keep the backbone out of the autograd graph
+        model.requires_grad_(False)
+        if hasattr(model, 'set_swish'):
+            # The memory-efficient swish is a custom autograd Function that vmap cannot batch
+            model.set_swish(memory_efficient=False)
+        self._local = threading.local()
+        model._blocks[-1].register_forward_hook(self._capture)
+
+    def _capture(self, module, inputs, output):
+        if getattr(self._local, 'active', False):
+            output = output.detach().requires_grad_()
+            self._local.activation = output
+            return output
+
+    def explain(self, image_tensor: 'torch.Tensor', top_k: int = 1) -> Tuple[np.ndarray, List[Tuple[int, np.ndarray]]]:
+        """Return (probabilities, [(class index, heatmap)]) for the top_k classes of one image
+
+        Heatmaps are at the block's resolution (7x7 for 224px input), scaled to [0, 1].
+        """
+        import torch
+
+        self._local.active = True
+        try:
+            with torch.enable_grad():
+                logits = self.model(image_tensor)
+            activation = self._local.activation
+        finally:
+            self._local.active = False
+            self._local.activation = None
+
+        probabilities = torch.softmax(logits.detach(), dim=1)[0]
+        top_k = max(1, min(top_k, probabilities.numel()))
+        top = torch.topk(probabilities, top_k).indices
+        selected = logits[0, top]
+
+        try:
+            # One vmapped backward: row i of the identity selects class top[i]
+            (grads,) = torch.autograd.grad(
+                selected, activation, grad_outputs=torch.eye(top_k), is_grads_batched=True, retain_graph=True
+            )
+            grads = grads[:, 0]
+        except RuntimeError:
+            # Ops without a batching rule: fall back to one backward per class over the same graph
+            grads = torch.stack([
+                torch.autograd.grad(selected[i], activation, retain_graph=i < top_k - 1)[0][0]
+                for i in range(top_k)
+            ])
+
+        # Channel weights are the spatially averaged gradients (k, C, 1, 1)
+        weights = grads.mean(dim=(2, 3), keepdim=True)
+        cams = torch.relu((weights * activation.detach()[0]).sum(dim=1))
+        cams = cams / cams.amax(dim=(1, 2), keepdim=True).clamp_min(1e-8)
+
+        heatmaps = [(int(index), cam.numpy()) for index, cam in zip(top, cams)]
+        return probabilities.numpy(), heatmaps
+
+class SaliencyCache:
+    """Bounded LRU of explanations by image hash, so reports overlay a heatmap without recomputing it"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_hash: str, version: Optional[str] = None, top_k: int = 1) -> Optional[Dict]:
+        """Cached explanation for this image, if it came from `version` and covers top_k classes"""
+        with self._lock:
+            entry = self._entries.get(image_hash)
+            if entry is None or (version is not None and entry['version'] != version) or len(entry['heatmaps']) < top_k:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(image_hash)
+            self.hits += 1
+            return entry
+
+    def put(self, image_hash: str, version: str, probabilities: np.ndarray, heatmaps: List[Tuple[int, np.ndarray]]):
+        with self._lock:
+            self._entries[image_hash] = {
+                'version': version,
+                'probabilities': probabilities,
+                # Low-resolution maps are a few hundred bytes each; float16 halves that again
+                'heatmaps': [(index, heatmap.astype(np.float16)) for index, heatmap in heatmaps],
+            }
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+def overlay_heatmap(image: Image.Image, heatmap: np.ndarray, alpha: float = 0.45) -> Image.Image:
+    """Upsample a low-resolution heatmap to the image and blend it in (blue = low, red = high)"""
+    image = image.convert('RGB')
+    heat = Image.fromarray(np.uint8(np.clip(heatmap.astype(np.float32), 0, 1) * 255))
+    # The model sees the image squashed to a square, so stretching the map back matches it
+    heat = heat.resize(image.size, Image.BILINEAR)
+    colored = ImageOps.colorize(heat, black='#1e3a8a', mid='#facc15', white='#dc2626')
+    return Image.blend(image, colored, alpha)
+
+def side_by_side(image: Image.Image, heatmap: np.ndarray, gap_ratio: float = 0.04) -> Image.Image:
+    """The original image next to its heatmap overlay, as one image for the report"""
+    image = image.convert('RGB')
+    gap = int(image.width * gap_ratio)
+    combined = Image.new('RGB', (image.width * 2 + gap, image.height), 'white')
+    combined.paste(image, (0, 0))
+    combined.paste(overlay_heatmap(image, heatmap), (image.width + gap, 0))
+    return combined
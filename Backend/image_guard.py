@@ -0,0 +1,227 @@
+import os
+import io
+import base64
+import binascii
+import threading
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+# Limits (overridable through the environment)
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', str(20 * 1024 * 1024)))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(12 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', str(40_000_000)))
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'BMP'}
+
+# Number of base64 characters decoded to read the header; JPEG SOF markers can sit behind EXIF/ICC data
+PROBE_CHARS = 96 * 1024
+
+def apply_pil_pixel_limit():
+    """Tie PIL's own decompression-bomb check to MAX_IMAGE_PIXELS (warning past it, error at twice)
+
+    This is process-wide PIL state, so the API server opts in at startup; the dataset CLIs that
+    import this module keep PIL's default limit.
+    """
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+class ImageRejected(HTTPException):
+    """An upload rejected before full decode (413 too large, 415 unsupported)"""
+    def __init__(self, status_code: int, reason: str, detail: str):
+        super().__init__(status_code=status_code, detail=detail)
+        self.reason = reason
+
+class IngestStats:
+    """Thread-safe counters for accepted/rejected uploads and the work avoided by early rejection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = {}
+        self.bytes_saved = 0
+        self.reduced_decodes = 0
+        self.pixels_saved = 0
+
+    def record_rejection(self, reason: str, bytes_saved: int):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+            self.bytes_saved += max(bytes_saved, 0)
+
+    def record_accepted(self):
+        with self._lock:
+            self.accepted += 1
+
+    def record_reduced_decode(self, full_size: Tuple[int, int], decoded_size: Tuple[int, int]):
+        with self._lock:
+            self.reduced_decodes += 1
+            self.pixels_saved += full_size[0] * full_size[1] - decoded_size[0] * decoded_size[1]
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'accepted': self.accepted,
+                'rejected': dict(self.rejected),
+                'rejected_total': sum(self.rejected.values()),
+                'bytes_saved': self.bytes_saved,
+                'reduced_decodes': self.reduced_decodes,
+                'pixels_saved': self.pixels_saved,
+                'limits': {
+                    'max_request_bytes': MAX_REQUEST_BYTES,
+                    'max_image_bytes': MAX_IMAGE_BYTES,
+                    'max_image_pixels': MAX_IMAGE_PIXELS,
+                    'allowed_formats': sorted(ALLOWED_FORMATS),
+                },
+            }
+
+ingest_stats = IngestStats()
+
+def _reject(status_code: int, reason: str, detail: str, bytes_saved: int = 0):
+    ingest_stats.record_rejection(reason, bytes_saved)
+    raise ImageRejected(status_code, reason, detail)
+
+def split_data_url(image_data: str) -> Tuple[Optional[str], str]:
+    """Split 'data:image/png;base64,....' into (mime type, base64 payload)"""
+    if image_data.startswith('data:'):
+        header, _, payload = image_data.partition(',')
+        return header[5:].split(';')[0], payload
+    return None, image_data
+
+def decoded_length(payload: str) -> int:
+    """Size in bytes of a base64 payload, computed without decoding it"""
+    payload = payload.rstrip()
+    padding = len(payload) - len(payload.rstrip('='))
+    return len(payload) * 3 // 4 - padding
+
+class ImageProbe:
+    """Format and dimensions read from the image header only"""
+    __slots__ = ('format', 'width', 'height', 'byte_size')
+
+    def __init__(self, format: str, width: int, height: int, byte_size: int):
+        self.format = format
+        self.width = width
+        self.height = height
+        self.byte_size = byte_size
+
+def _open_header(data: bytes) -> Image.Image:
+    """Open an image lazily: PIL parses the header here and defers pixel decoding"""
+    return Image.open(io.BytesIO(data), formats=list(ALLOWED_FORMATS))
+
+def probe_image(image_data: str) -> ImageProbe:
+    """Validate size, format and dimensions of a base64 image from its header alone"""
+    mime_type, payload = split_data_url(image_data)
+    byte_size = decoded_length(payload)
+
+    if mime_type is not None and mime_type.split('/')[-1].upper().replace('JPG', 'JPEG') not in ALLOWED_FORMATS:
+        _reject(415, 'unsupported_format', f"Unsupported image type '{mime_type}'", byte_size)
+    if byte_size > MAX_IMAGE_BYTES:
+        _reject(413, 'image_too_large', f"Image is {byte_size} bytes; the limit is {MAX_IMAGE_BYTES}", byte_size)
+
+    # Decode only the leading chunk of the base64 payload (aligned to 4 characters)
+    prefix = payload[:PROBE_CHARS - PROBE_CHARS % 4]
+    try:
+        header_bytes = base64.b64decode(prefix)
+    except (binascii.Error, ValueError):
+        _reject(415, 'undecodable', "Image data is not valid base64", byte_size)
+
+    try:
+        image = _open_header(header_bytes)
+    except Exception:
+        if len(prefix) >= len(payload):
+            _reject(415, 'unsupported_format', "Image format is not supported or the header is corrupt", byte_size)
+        # Header did not fit in the probe window; open lazily from the full payload (still no pixel decode)
+        try:
+            image = _open_header(base64.b64decode(payload))
+        except Exception:
+            _reject(415, 'unsupported_format', "Image format is not supported or the header is corrupt", byte_size)
+
+    return _check_dimensions(image, byte_size)
+
+def probe_image_bytes(image_bytes: bytes) -> ImageProbe:
+    """Validate size, format and dimensions of raw image bytes (e.g. WebSocket frames) from the header"""
+    byte_size = len(image_bytes)
+    if byte_size > MAX_IMAGE_BYTES:
+        _reject(413, 'image_too_large', f"Image is {byte_size} bytes; the limit is {MAX_IMAGE_BYTES}", byte_size)
+    try:
+        image = _open_header(image_bytes)
+    except Exception:
+        _reject(415, 'unsupported_format', "Image format is not supported or the header is corrupt", byte_size)
+    return _check_dimensions(image, byte_size)
+
+def _check_dimensions(image: Image.Image, byte_size: int) -> ImageProbe:
+    """Reject images whose header declares invalid or too many pixels"""
+    width, height = image.size
+    if width <= 0 or height <= 0:
+        _reject(415, 'unsupported_format', "Image has invalid dimensions", byte_size)
+    if width * height > MAX_IMAGE_PIXELS:
+        _reject(413, 'too_many_pixels', f"Image is {width}x{height}; the limit is {MAX_IMAGE_PIXELS} pixels", byte_size)
+
+    return ImageProbe(image.format, width, height, byte_size)
+
+def open_image(image_bytes: bytes, min_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """Open image bytes, using JPEG reduced-size (DCT scaling) decoding when min_size allows it"""
+    image = _open_header(image_bytes)
+    full_size = image.size
+    if min_size is not None and image.format == 'JPEG':
+        # draft() picks the largest 1/2, 1/4 or 1/8 scale that is still at least min_size
+        image.draft('RGB', min_size)
+        if image.size != full_size:
+            ingest_stats.record_reduced_decode(full_size, image.size)
+    return image
+
+def load_image_bytes(image_data: str) -> bytes:
+    """Probe a base64 image and return its decoded bytes once it passes"""
+    probe_image(image_data)
+    _, payload = split_data_url(image_data)
+    image_bytes = base64.b64decode(payload)
+    ingest_stats.record_accepted()
+    return image_bytes
+
+class RequestSizeLimitMiddleware:
+    """ASGI middleware capping request bodies, counting bytes as they stream in"""
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        content_length = headers.get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            # Reject from the header alone, before reading any of the body
+            ingest_stats.record_rejection('body_too_large', int(content_length))
+            await self._too_large(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    ingest_stats.record_rejection('body_too_large', 0)
+                    raise ImageRejected(413, 'body_too_large', f"Request body exceeds {self.max_bytes} bytes")
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except ImageRejected:
+            if response_started:
+                raise
+            await self._too_large(scope, receive, send)
+
+    async def _too_large(self, scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": f"Request body exceeds {self.max_bytes} bytes"})
+        await response(scope, receive, send)
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+PRIORITY_CLASSES = ('interactive', 'bulk')
+
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.1
+
+class DeadlineExceeded(Exception):
+    """Raised for requests whose deadline passed while they were queued"""
+    pass
+
+class QueueFull(Exception):
+    """Raised when a priority class already holds its maximum number of queued requests"""
+    pass
+
+class ClientDisconnected(Exception):
+    """Raised for requests whose client went away while they were waiting"""
+    pass
+
+class _Job:
+    __slots__ = ('fn', 'args', 'future', 'enqueued_at', 'deadline')
+
+    def __init__(self, fn, args, future, deadline):
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+
+class InferenceScheduler:
+    """Priority, per-client fair and deadline-aware queue in front of the model
+
+    Interactive requests are always dequeued before bulk ones, clients within a class are
+    served round-robin, and requests whose deadline has passed (or whose caller went away)
+    are dropped before they reach the model. Bulk work may use at most ``bulk_slots``
+    workers so that one worker is kept free for interactive arrivals.
+    """
+
+    def __init__(self, concurrency: int = 2, bulk_slots: Optional[int] = None,
+                 max_queue: int = 1000, stats_window: int = 1000):
+        self.concurrency = max(1, concurrency)
+        self.bulk_slots = bulk_slots if bulk_slots is not None else max(1, self.concurrency - 1)
+        self.max_queue = max_queue
+
+        # priority -> client_id -> deque of jobs; OrderedDict order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_CLASSES}
+        self._queued = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._wakeup = None
+        self._workers = []
+
+        self._wait_ms = {priority: deque(maxlen=stats_window) for priority in PRIORITY_CLASSES}
+        self._counters = {
+            priority: {'completed': 0, 'failed': 0, 'dropped_deadline': 0, 'cancelled': 0, 'rejected_full': 0}
+            for priority in PRIORITY_CLASSES
+        }
+
+    async def start(self):
+        """Start the worker tasks (call from the application's startup event)"""
+        self._wakeup = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Cancel the worker tasks"""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    async def submit(self, fn: Callable, *args, priority: str = 'interactive',
+                     client_id: str = 'anonymous', deadline_ms: Optional[float] = None,
+                     is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """Queue fn(*args) to run in the threadpool and wait for its result
+
+        `is_disconnected` (e.g. Starlette's Request.is_disconnected) is polled while waiting;
+        Starlette does not cancel a handler when its client goes away, so without it a
+        disconnected request still runs.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class '{priority}'. Available: {list(PRIORITY_CLASSES)}")
+        if self._queued[priority] >= self.max_queue:
+            self._counters[priority]['rejected_full'] += 1
+            raise QueueFull(f"The {priority} queue is full")
+
+        deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+        job = _Job(fn, args, asyncio.get_running_loop().create_future(), deadline)
+
+        async with self._wakeup:
+            self._queues[priority].setdefault(client_id, deque()).append(job)
+            self._queued[priority] += 1
+            self._wakeup.notify()
+
+        if is_disconnected is None:
+            return await job.future
+
+        # Cancelling the future makes the worker skip the job instead of running a forward
+        # pass for nobody (a job already running finishes, and its result is discarded)
+        while True:
+            done, _ = await asyncio.wait({job.future}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return job.future.result()
+            if await is_disconnected():
+                job.future.cancel()
+                raise ClientDisconnected("Client disconnected before inference finished")
+
+    def _next_job(self):
+        """Pick the next runnable job, or None; must be called with the condition held"""
+        for priority in PRIORITY_CLASSES:
+            if priority == 'bulk' and self._running['bulk'] >= self.bulk_slots:
+                continue
+
+            clients = self._queues[priority]
+            while clients:
+                client_id, jobs = next(iter(clients.items()))
+                job = jobs.popleft()
+                self._queued[priority] -= 1
+                if jobs:
+                    clients.move_to_end(client_id)
+                else:
+                    del clients[client_id]
+
+                if job.future.done():
+                    self._counters[priority]['cancelled'] += 1
+                    continue
+                if job.deadline is not None and time.monotonic() > job.deadline:
+                    self._counters[priority]['dropped_deadline'] += 1
+                    job.future.set_exception(DeadlineExceeded("Request deadline passed before inference"))
+                    continue
+                return priority, job
+
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                picked = self._next_job()
+                while picked is None:
+                    await self._wakeup.wait()
+                    picked = self._next_job()
+                priority, job = picked
+                self._running[priority] += 1
+
+            self._wait_ms[priority].append((time.monotonic() - job.enqueued_at) * 1000)
+            try:
+                result = await run_in_threadpool(job.fn, *job.args)
+                if not job.future.done():
+                    job.future.set_result(result)
+                self._counters[priority]['completed'] += 1
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                self._counters[priority]['failed'] += 1
+            finally:
+                async with self._wakeup:
+                    self._running[priority] -= 1
+                    # A freed bulk slot may make a waiting bulk job runnable
+                    self._wakeup.notify_all()
+
+    def queue_depth(self) -> int:
+        """Total number of queued (not yet running) requests"""
+        return sum(self._queued.values())
+
+    def stats(self) -> Dict:
+        """Per-class queue depth, outcome counters and queue wait percentiles"""
+        classes = {}
+        for priority in PRIORITY_CLASSES:
+            waits = np.array(self._wait_ms[priority]) if self._wait_ms[priority] else None
+            classes[priority] = {
+                'queued': self._queued[priority],
+                'running': self._running[priority],
+                'clients_waiting': len(self._queues[priority]),
+                **self._counters[priority],
+                'wait_ms': {
+                    'p50': float(np.percentile(waits, 50)) if waits is not None else 0.0,
+                    'p95': float(np.percentile(waits, 95)) if waits is not None else 0.0,
+                    'p99': float(np.percentile(waits, 99)) if waits is not None else 0.0,
+                    'max': float(waits.max()) if waits is not None else 0.0,
+                },
+            }
+
+        return {
+            'concurrency': self.concurrency,
+            'bulk_slots': self.bulk_slots,
+            'max_queue': self.max_queue,
+            'classes': classes,
+        }
@@ -0,0 +1,204 @@
+import os
+import csv
+import json
+import copy
+import time
+import hashlib
+from typing import Callable, Dict, Optional
+import numpy as np
+import torch
+import torch.nn as nn
+import torchvision.transforms as transforms
+from efficientnet_pytorch import EfficientNet
+
+# Location of the trained checkpoints produced by the DermaScan notebook
+ML_DIR = os.path.join(os.path.dirname(__file__), '..', '#ML', 'DermaScan')
+DEFAULT_CLASSIFIER_PATH = os.path.join(ML_DIR, 'disease_classifier.pth')
+DATA_DIR = os.path.join(ML_DIR, 'DATA')
+RESOLUTION_PROFILES_PATH = os.path.join(ML_DIR, 'resolution_profiles.json')
+
+# Architecture used by disease_classifier.pth when no sidecar file is present
+DEFAULT_ARCHITECTURE = {
+    'model_name': 'efficientnet-b0',
+    'width_coefficient': None,
+    'depth_coefficient': None,
+    'image_size': 224,
+}
+
+# Named input resolutions served side by side. A profile is only enabled when its checkpoint
+# exists; profile_resolutions.py can validate the base checkpoint at a lower size instead.
+# 'full' serves the base checkpoint at the size in its sidecar (224 without one).
+# max_inflight is the load (concurrent classify calls) above which "auto" skips the profile.
+DEFAULT_RESOLUTION_PROFILES = {
+    'full': {'image_size': 224, 'checkpoint': None, 'max_inflight': 2},
+    'balanced': {'image_size': 192, 'checkpoint': 'disease_classifier_192.pth', 'max_inflight': 6},
+    'fast': {'image_size': 160, 'checkpoint': 'disease_classifier_160.pth', 'max_inflight': None},
+}
+
+# ImageNet normalisation used by the training notebook
+NORMALIZE_MEAN = [0.485, 0.456, 0.406]
+NORMALIZE_STD = [0.229, 0.224, 0.225]
+
+def eval_transform(image_size: int = 224) -> transforms.Compose:
+    """Inference-time transform, identical to the notebook's val_transform"""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=NORMALIZE_MEAN, std=NORMALIZE_STD)
+    ])
+
+def train_transform(image_size: int = 224) -> transforms.Compose:
+    """Training-time augmentation, identical to the notebook's train_transform"""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.RandomHorizontalFlip(),
+        transforms.RandomRotation(15),
+        transforms.ColorJitter(brightness=0.3, contrast=0.3, saturation=0.3, hue=0.2),
+        transforms.RandomAffine(degrees=0, translate=(0.1, 0.1), scale=(0.8, 1.2)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=NORMALIZE_MEAN, std=NORMALIZE_STD)
+    ])
+
+def architecture_path(checkpoint_path: str) -> str:
+    """Path of the JSON sidecar describing the architecture of a checkpoint"""
+    return os.path.splitext(checkpoint_path)[0] + '.arch.json'
+
+def read_architecture(checkpoint_path: str) -> Dict:
+    """Read the architecture sidecar of a checkpoint, defaulting to EfficientNet-B0"""
+    architecture = dict(DEFAULT_ARCHITECTURE)
+    sidecar = architecture_path(checkpoint_path)
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r') as f:
+            architecture.update(json.load(f))
+    return architecture
+
+def build_classifier(num_classes: int, architecture: Optional[Dict] = None, pretrained: bool = False) -> nn.Module:
+    """Build an EfficientNet classifier with the requested width/depth scaling"""
+    architecture = dict(DEFAULT_ARCHITECTURE, **(architecture or {}))
+    overrides = {'image_size': architecture['image_size']}
+    for key in ('width_coefficient', 'depth_coefficient'):
+        if architecture.get(key) is not None:
+            overrides[key] = architecture[key]
+
+    if pretrained and len(overrides) == 1:
+        # ImageNet weights only exist for the stock scaling coefficients
+        model = EfficientNet.from_pretrained(architecture['model_name'], image_size=overrides['image_size'])
+        model._fc = nn.Linear(model._fc.in_features, num_classes)
+    else:
+        model = EfficientNet.from_name(architecture['model_name'], num_classes=num_classes, **overrides)
+
+    return model
+
+def load_classifier(checkpoint_path: str, num_classes: int, device: torch.device) -> nn.Module:
+    """Load a classifier checkpoint (plain state dict plus optional architecture sidecar)"""
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"Classification model not found at {checkpoint_path}")
+
+    model = build_classifier(num_classes, read_architecture(checkpoint_path))
+    model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
+
+def checkpoint_version(checkpoint_path: str) -> str:
+    """Stable model version string: checkpoint file name plus a short content hash"""
+    digest = hashlib.sha256()
+    with open(checkpoint_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return f"{os.path.basename(checkpoint_path)}@{digest.hexdigest()[:12]}"
+
+def save_classifier(model: nn.Module, checkpoint_path: str, architecture: Optional[Dict] = None):
+    """Save a classifier in the format load_classifier() understands"""
+    torch.save(model.state_dict(), checkpoint_path)
+    if architecture is not None:
+        with open(architecture_path(checkpoint_path), 'w') as f:
+            json.dump(dict(DEFAULT_ARCHITECTURE, **architecture), f, indent=2)
+
+def measure_latency(model: nn.Module, image_size: int, device: torch.device, runs: int = 50, warmup: int = 5) -> Dict:
+    """Single-image latency at the given resolution, matching the per-request cost of /api/classify"""
+    dummy = torch.randn(1, 3, image_size, image_size).to(device)
+    timings = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(dummy)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(dummy)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'median_ms': float(np.median(timings)),
+        'p95_ms': float(np.percentile(timings, 95)),
+    }
+
+def manifest_filter(manifest_path: Optional[str], data_dir: str, split: str) -> Optional[Callable[[str], bool]]:
+    """ImageFolder is_valid_file callback keeping only the split's rows of a dedupe_dataset.py manifest"""
+    if not manifest_path:
+        return None
+    with open(manifest_path, newline='') as f:
+        kept = {os.path.normpath(os.path.join(data_dir, row['path'])) for row in csv.DictReader(f) if row['split'] == split}
+    return lambda path: os.path.normpath(path) in kept
+
+def read_resolution_profiles(config_path: str = RESOLUTION_PROFILES_PATH, base_path: Optional[str] = None) -> Dict:
+    """Default resolution profiles merged with the JSON written by profile_resolutions.py
+
+    With base_path, the 'full' profile takes the resolution the base checkpoint was trained at
+    (e.g. a distilled student served through DISEASE_CLASSIFIER_PATH).
+    """
+    profiles = copy.deepcopy(DEFAULT_RESOLUTION_PROFILES)
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            for name, profile in json.load(f).items():
+                profiles.setdefault(name, {}).update(profile)
+    if base_path is not None:
+        profiles['full']['image_size'] = read_architecture(base_path)['image_size']
+    return profiles
+
+def resolve_checkpoint(checkpoint: Optional[str], base_path: str) -> str:
+    """Resolve a profile checkpoint; None means the base checkpoint, relative paths live in ML_DIR"""
+    if not checkpoint:
+        return base_path
+    if os.path.isabs(checkpoint):
+        return checkpoint
+    return os.path.join(ML_DIR, checkpoint)
+
+def load_resolution_profiles(base_path: str, base_model: nn.Module, num_classes: int,
+                             device: torch.device, config_path: str = RESOLUTION_PROFILES_PATH) -> Dict:
+    """Load every resolution profile whose checkpoint is available, sharing models between profiles"""
+    models = {os.path.abspath(base_path): base_model}
+    versions = {}
+    loaded = {}
+
+    for name, profile in read_resolution_profiles(config_path, base_path).items():
+        image_size = profile['image_size']
+        if image_size % 32 != 0:
+            # EfficientNet's static "same" padding only matches across sizes that are multiples of 32
+            print(f"Resolution profile '{name}' disabled: image_size {image_size} is not a multiple of 32")
+            continue
+
+        if profile.get('validated') is False:
+            print(f"Resolution profile '{name}' disabled: it failed accuracy validation in profile_resolutions.py")
+            continue
+
+        checkpoint = resolve_checkpoint(profile.get('checkpoint'), base_path)
+        key = os.path.abspath(checkpoint)
+        if key not in models:
+            if not os.path.exists(checkpoint):
+                print(f"Resolution profile '{name}' disabled: {checkpoint} not found")
+                continue
+            models[key] = load_classifier(checkpoint, num_classes, device)
+        if key not in versions:
+            versions[key] = checkpoint_version(checkpoint)
+
+        loaded[name] = {
+            'image_size': image_size,
+            'checkpoint': checkpoint,
+            'version': versions[key],
+            'max_inflight': profile.get('max_inflight'),
+            'metrics': profile.get('metrics'),
+            'model': models[key],
+            'transform': eval_transform(image_size),
+        }
+
+    return loaded
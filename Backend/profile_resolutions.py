@@ -0,0 +1,104 @@
+import os
+import json
+import argparse
+from datetime import datetime
+import torch
+from torch.utils.data import DataLoader
+from torchvision import datasets
+import numpy as np
+from model_loader import (
+    DATA_DIR, DEFAULT_CLASSIFIER_PATH, RESOLUTION_PROFILES_PATH,
+    load_classifier, read_resolution_profiles, resolve_checkpoint, eval_transform, manifest_filter,
+    measure_latency
+)
+
+class_names = ['Acne', 'Actinic Keratosis', 'Basal Cell Carcinoma', 'Eczemaa', 'Rosacea']
+
+def predict_dataset(model, data_dir: str, image_size: int, batch_size: int, device, manifest: str = None) -> tuple:
+    """Return (predictions, labels) for the held-out split at the given resolution"""
+    dataset = datasets.ImageFolder(os.path.join(data_dir, 'testing'), transform=eval_transform(image_size),
+                                   is_valid_file=manifest_filter(manifest, data_dir, 'testing'))
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+    predictions = []
+    labels = []
+    with torch.no_grad():
+        for images, batch_labels in loader:
+            outputs = model(images.to(device))
+            predictions.append(outputs.argmax(dim=1).cpu().numpy())
+            labels.append(batch_labels.numpy())
+
+    return np.concatenate(predictions), np.concatenate(labels)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure latency and accuracy for each resolution profile")
+    parser.add_argument('--base', default=DEFAULT_CLASSIFIER_PATH, help="Base (224px) checkpoint")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Dataset root containing testing/")
+    parser.add_argument('--manifest', default=None, help="Cleaned split manifest from dedupe_dataset.py")
+    parser.add_argument('--config', default=RESOLUTION_PROFILES_PATH, help="Resolution profiles JSON")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                        help="Largest accuracy loss vs the full profile for a profile to count as validated")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--write', action='store_true', help="Write the measured profiles back to --config")
+    return parser.parse_args()
+
+def main():
+    """Profile every configured resolution and optionally persist the results for the API"""
+    args = parse_args()
+    device = torch.device("cpu")
+    profiles = read_resolution_profiles(args.config, args.base)
+
+    base_model = load_classifier(args.base, len(class_names), device)
+    full_size = profiles['full']['image_size']
+    full_predictions, labels = predict_dataset(base_model, args.data_dir, full_size, args.batch_size, device, args.manifest)
+    full_accuracy = float((full_predictions == labels).mean())
+
+    print(f"{'Profile':<12} {'Size':<6} {'Checkpoint':<30} {'Accuracy':<10} {'Agreement':<10} {'Median ms':<10} {'Validated':<10}")
+    print(f"{'-'*90}")
+
+    for name, profile in sorted(profiles.items(), key=lambda item: -item[1]['image_size']):
+        image_size = profile['image_size']
+        configured = profile.get('checkpoint')
+        checkpoint = resolve_checkpoint(configured, args.base)
+
+        if os.path.exists(checkpoint):
+            # Fine-tuned checkpoint for this resolution
+            model = load_classifier(checkpoint, len(class_names), device)
+        else:
+            # No dedicated checkpoint: check whether the base model holds up at this size
+            checkpoint = args.base
+            model = base_model
+
+        predictions, _ = predict_dataset(model, args.data_dir, image_size, args.batch_size, device, args.manifest)
+        accuracy = float((predictions == labels).mean())
+        agreement = float((predictions == full_predictions).mean())
+        latency = measure_latency(model, image_size, device)
+        # Dedicated checkpoints are held to the same accuracy bar as the base model at a lower size
+        validated = full_accuracy - accuracy <= args.max_accuracy_drop
+
+        if checkpoint != args.base:
+            profile['checkpoint'] = os.path.basename(checkpoint)
+        elif validated:
+            profile['checkpoint'] = None
+        else:
+            # Keep pointing at the (missing) dedicated checkpoint so the API leaves this profile disabled
+            profile['checkpoint'] = configured or f"disease_classifier_{image_size}.pth"
+        profile['validated'] = validated
+        profile['metrics'] = {
+            'accuracy': accuracy,
+            'agreement_with_full': agreement,
+            'latency_ms': latency['median_ms'],
+            'latency_p95_ms': latency['p95_ms'],
+            'profiled_at': datetime.now().isoformat(),
+        }
+
+        print(f"{name:<12} {image_size:<6} {os.path.basename(checkpoint):<30} {accuracy:<10.2%} "
+              f"{agreement:<10.2%} {latency['median_ms']:<10.1f} {'Yes' if validated else 'No':<10}")
+
+    if args.write:
+        with open(args.config, 'w') as f:
+            json.dump(profiles, f, indent=2)
+        print(f"\nProfiles written to {args.config}")
+
+if __name__ == "__main__":
+    main()
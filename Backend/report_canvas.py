@@ -0,0 +1,300 @@
+import io
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.lib.colors import HexColor, black, white
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph
+
+# Page geometry matching SimpleDocTemplate defaults (1 inch margins, 6pt frame padding)
+PAGE_WIDTH, PAGE_HEIGHT = letter
+CONTENT_LEFT = inch + 6
+CONTENT_WIDTH = PAGE_WIDTH - 2 * inch - 12
+CONTENT_TOP = PAGE_HEIGHT - inch - 6
+CONTENT_BOTTOM = inch + 6
+CENTER_X = CONTENT_LEFT + CONTENT_WIDTH / 2
+
+BLUE = HexColor('#1e40af')
+GREEN = HexColor('#059669')
+LIGHT_GRAY = HexColor('#f3f4f6')
+FOOTER_GRAY = HexColor('#6b7280')
+
+DISCLAIMER_TEXT = (
+    "This report is generated by an AI-powered skin analysis tool for educational and informational purposes only. "
+    "The results shown are approximations based on AI analysis and should not be considered as definitive medical diagnoses. "
+    "This tool is NOT a substitute for professional medical advice, diagnosis, or treatment. "
+    "Always consult with a qualified dermatologist or healthcare provider for accurate diagnosis and appropriate treatment. "
+    "The confidence percentages indicate the model's certainty in classification, not medical accuracy. "
+    "Results may vary and should not be used for self-diagnosis or treatment decisions. "
+    "If you have concerns about your skin condition, please schedule an appointment with a dermatologist "
+    "for proper evaluation and treatment."
+)
+
+# The disclaimer never changes, so wrap it once at import
+DISCLAIMER_LINES = simpleSplit(DISCLAIMER_TEXT, 'Helvetica', 10, CONTENT_WIDTH)
+
+class LayoutOverflow(Exception):
+    """A single block is taller than a whole page, which only the platypus engine can split"""
+    pass
+
+class CanvasReportRenderer:
+    """Fixed-layout report drawn straight onto a pdfgen canvas
+
+    Mirrors the platypus layout of MedicalReportGenerator (same styles, spacing and
+    tables) with precomputed coordinates, moving a block to the next page when it does
+    not fit like the frame does. Only variable-length text (recommendations and the
+    Grad-CAM caption), whose line wrapping varies per report, goes through platypus
+    Paragraphs. A block taller than a
+    page raises LayoutOverflow so the caller can fall back to the full platypus engine.
+    A renderer holds the cursor state of one report, so create one per report.
+    """
+
+    def __init__(self, styles):
+        self.styles = styles
+        self.canvas = None
+        self.y = CONTENT_TOP
+        # spaceAfter of the previous flowable; the frame overlaps it with the next spaceBefore
+        self.prev_space_after = 0
+
+    def render(self, analysis_data: Dict, pil_image, patient_name: str, image_error: Optional[str] = None,
+               caption: Optional[str] = None) -> bytes:
+        buffer = io.BytesIO()
+        self.canvas = canvas.Canvas(buffer, pagesize=letter)
+        self.y = CONTENT_TOP
+        now = datetime.now()
+
+        self._header(now)
+        self._patient_info(patient_name, now)
+        self._image(pil_image, image_error, caption)
+        self._results(analysis_data)
+        self._recommendations(analysis_data.get('recommendations', []))
+        self._products(analysis_data.get('products', []))
+        self._disclaimer()
+
+        self.canvas.showPage()
+        self.canvas.save()
+        return buffer.getvalue()
+
+    # Drawing primitives
+
+    def _new_page(self):
+        self.canvas.showPage()
+        self.y = CONTENT_TOP
+        self.prev_space_after = 0
+
+    def _ensure(self, height: float) -> bool:
+        """Start a new page if a block of this height does not fit; True if it did"""
+        if height > CONTENT_TOP - CONTENT_BOTTOM:
+            raise LayoutOverflow(f"Block of {height:.0f}pt is taller than a page")
+        if self.y - height < CONTENT_BOTTOM:
+            self._new_page()
+            return True
+        return False
+
+    def _space(self, height: float):
+        """Vertical spacer; like platypus, one that does not fit just ends the page"""
+        if self.y - height < CONTENT_BOTTOM:
+            self._new_page()
+        else:
+            self.y -= height
+        self.prev_space_after = 0
+
+    def _text(self, text: str, font: str, size: float, leading: float, color=black,
+              align: str = 'left', space_before: float = 0, space_after: float = 0):
+        """Draw a single-line paragraph and advance the cursor like platypus would"""
+        # spaceBefore is dropped at the top of a page and overlaps the previous spaceAfter
+        space_before = max(space_before - self.prev_space_after, 0)
+        if self.y < CONTENT_TOP and not self._ensure(space_before + leading):
+            self.y -= space_before
+        baseline = self.y - size
+        self.canvas.setFont(font, size)
+        self.canvas.setFillColor(color)
+        if align == 'center':
+            self.canvas.drawCentredString(CENTER_X, baseline, text)
+        else:
+            self.canvas.drawString(CONTENT_LEFT, baseline, text)
+        self.y -= leading + space_after
+        self.prev_space_after = space_after
+
+    def _section_header(self, text: str):
+        self._text(text, 'Helvetica-Bold', 12, 14, BLUE, space_before=12, space_after=8)
+
+    def _normal(self, text: str, bold_prefix: Optional[str] = None):
+        """NormalText paragraph, optionally starting with a bold label"""
+        self._ensure(12)
+        baseline = self.y - 10
+        x = CONTENT_LEFT
+        if bold_prefix:
+            self.canvas.setFont('Helvetica-Bold', 10)
+            self.canvas.setFillColor(black)
+            self.canvas.drawString(x, baseline, bold_prefix)
+            x += self.canvas.stringWidth(bold_prefix + ' ', 'Helvetica-Bold', 10)
+        self.canvas.setFont('Helvetica', 10)
+        self.canvas.setFillColor(black)
+        self.canvas.drawString(x, baseline, text)
+        self.y -= 12 + 6
+        self.prev_space_after = 6
+
+    def _paragraph(self, text: str):
+        """Variable-length NormalText: let platypus wrap it, then draw it at the cursor"""
+        paragraph = Paragraph(text, self.styles['NormalText'])
+        _, height = paragraph.wrap(CONTENT_WIDTH, PAGE_HEIGHT)
+        self._ensure(height)
+        paragraph.drawOn(self.canvas, CONTENT_LEFT, self.y - height)
+        self.y -= height + self.styles['NormalText'].spaceAfter
+        self.prev_space_after = self.styles['NormalText'].spaceAfter
+
+    def _table(self, rows: List[List[str]], col_widths: List[float], font_size: float, bottom_padding: float,
+               header_background=None, label_background=None):
+        """Grid table with a bold header row or bold label column, centred in the frame"""
+        # Table cells keep the default 12pt leading whatever their font size
+        leading = 12
+        top_padding = 3
+        row_height = leading + top_padding + bottom_padding
+        table_width = sum(col_widths)
+        left = CENTER_X - table_width / 2
+        height = row_height * len(rows)
+        self._ensure(height)
+        top = self.y
+
+        c = self.canvas
+        if header_background is not None:
+            c.setFillColor(header_background)
+            c.rect(left, top - row_height, table_width, row_height, stroke=0, fill=1)
+        if label_background is not None:
+            c.setFillColor(label_background)
+            c.rect(left, top - height, col_widths[0], height, stroke=0, fill=1)
+
+        for r, row in enumerate(rows):
+            baseline = top - (r + 1) * row_height + bottom_padding + leading - font_size
+            x = left
+            for col, value in enumerate(row):
+                is_header = header_background is not None and r == 0
+                is_label = label_background is not None and col == 0
+                c.setFont('Helvetica-Bold' if is_header or is_label else 'Helvetica', font_size)
+                c.setFillColor(white if is_header else black)
+                c.drawString(x + 6, baseline, str(value))
+                x += col_widths[col]
+
+        # Grid lines
+        c.setStrokeColor(black)
+        c.setLineWidth(1)
+        xs = [left]
+        for width in col_widths:
+            xs.append(xs[-1] + width)
+        ys = [top - r * row_height for r in range(len(rows) + 1)]
+        c.grid(xs, ys)
+
+        self.y -= height
+        self.prev_space_after = 0
+
+    # Sections
+
+    def _header(self, now: datetime):
+        self._text("Inveep Inc", 'Helvetica-Bold', 16, 22, BLUE, align='center', space_after=20)
+        self._text("MedicImage - DermaScan", 'Helvetica-Bold', 14, 18, BLUE, align='center', space_before=12, space_after=15)
+        self._text(f"Report Generated: {now.strftime('%B %d, %Y at %I:%M %p')}", 'Helvetica', 10, 12, space_after=6)
+        self._space(20)
+        self._text("SKIN ANALYSIS REPORT", 'Helvetica-Bold', 18, 22, align='center', space_after=25)
+        self._space(15)
+
+    def _patient_info(self, patient_name: str, now: datetime):
+        self._section_header("PATIENT INFORMATION")
+        self._table(
+            [
+                ["Patient Name:", patient_name],
+                ["Report Date:", now.strftime("%B %d, %Y")],
+                ["Report Time:", now.strftime("%I:%M %p")],
+                ["Analysis Type:", "AI-Powered Skin Condition Classification"],
+            ],
+            [2 * inch, 4 * inch], font_size=10, bottom_padding=6, label_background=LIGHT_GRAY
+        )
+        self._space(15)
+
+    def _image(self, pil_image, image_error: Optional[str], caption: Optional[str] = None):
+        self._section_header("ANALYZED IMAGE")
+        if pil_image is None:
+            self._paragraph(f"Image could not be processed: {image_error}")
+        else:
+            # A caption means the image is the side-by-side Grad-CAM pair, which gets the wider box
+            width, height = self.image_size(pil_image, 6 * inch if caption else 4 * inch)
+            self._ensure(height)
+            if pil_image.mode not in ('RGB', 'L'):
+                pil_image = pil_image.convert('RGB')
+            # Hand the decoded pixels to ReportLab directly instead of re-encoding to PNG first
+            self.canvas.drawImage(ImageReader(pil_image), CENTER_X - width / 2, self.y - height, width, height)
+            self.y -= height
+            self.prev_space_after = 0
+            if caption:
+                self._paragraph(caption)
+        self._space(15)
+
+    @staticmethod
+    def image_size(pil_image, max_width: float = 4 * inch) -> Tuple[float, float]:
+        """Same fit rule as MedicalReportGenerator._create_image_section"""
+        max_height = 3 * inch
+        aspect_ratio = pil_image.width / pil_image.height
+        if aspect_ratio > 1:  # Landscape
+            width = min(max_width, pil_image.width)
+            height = width / aspect_ratio
+        else:  # Portrait
+            height = min(max_height, pil_image.height)
+            width = height * aspect_ratio
+        return width, height
+
+    def _results(self, analysis_data: Dict):
+        self._section_header("ANALYSIS RESULTS")
+        self._normal(str(analysis_data.get('primary_condition', 'Unknown')), bold_prefix="Primary Condition:")
+        self._normal(f"{analysis_data.get('confidence', 0):.1%}", bold_prefix="Confidence Level:")
+        self._space(10)
+
+        predictions = analysis_data.get('predictions', {})
+        if predictions:
+            self._normal("", bold_prefix="Condition Probabilities:")
+            rows = [["Condition", "Probability", "Severity"]]
+            for condition, probability in predictions.items():
+                severity = "High" if probability >= 0.7 else "Medium" if probability >= 0.4 else "Low"
+                rows.append([condition, f"{probability:.1%}", severity])
+            self._table(rows, [2.5 * inch, 1.5 * inch, 1 * inch], font_size=9, bottom_padding=4, header_background=BLUE)
+        self._space(15)
+
+    def _recommendations(self, recommendations: List[str]):
+        self._section_header("RECOMMENDATIONS")
+        if not recommendations:
+            self._normal("Please consult with a dermatologist for personalized recommendations.")
+        else:
+            for i, rec in enumerate(recommendations, 1):
+                self._paragraph(f"{i}. {rec}")
+        self._space(15)
+
+    def _products(self, products: List[Dict]):
+        self._section_header("RECOMMENDED PRODUCTS")
+        if products:
+            rows = [["Product", "Brand", "Rating", "Price"]]
+            for product in products[:5]:  # Limit to 5 products
+                rows.append([
+                    product.get('name', 'N/A'),
+                    product.get('brand', 'N/A'),
+                    f"{product.get('rating', 0)} ★",
+                    product.get('price', 'N/A')
+                ])
+            self._table(rows, [2 * inch, 1.5 * inch, 0.8 * inch, 1 * inch], font_size=8, bottom_padding=4, header_background=GREEN)
+        else:
+            self._normal("Product recommendations will be available based on your specific condition.")
+        self._space(15)
+
+    def _disclaimer(self):
+        self._section_header("IMPORTANT DISCLAIMER")
+        self._ensure(12 * len(DISCLAIMER_LINES))
+        c = self.canvas
+        c.setFont('Helvetica', 10)
+        c.setFillColor(black)
+        for line in DISCLAIMER_LINES:
+            c.drawString(CONTENT_LEFT, self.y - 10, line)
+            self.y -= 12
+        self.y -= 6
+        self.prev_space_after = 6
+        self._space(20)
+        self._text("Generated by MedicImage DermaScan - Inveep Inc", 'Helvetica', 8, 12, FOOTER_GRAY, align='center')
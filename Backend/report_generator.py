@@ -2,20 +2,25 @@ import os
 import base64
 import io
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.colors import HexColor, black, white
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
+from PIL import Image as PILImage
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from PIL import Image as PILImage
+from image_guard import open_image
+from report_canvas import CanvasReportRenderer, LayoutOverflow
+from explainability import side_by_side
 
 class MedicalReportGenerator:
-    def __init__(self):
+    def __init__(self, engine: str = None):
         self.page_width, self.page_height = letter
+        # "platypus" (flowing layout) or "canvas" (fixed-layout fast path)
+        self.engine = engine or os.environ.get('REPORT_ENGINE', 'platypus')
         self.setup_styles()
     
     def setup_styles(self):
@@ -98,18 +103,31 @@ class MedicalReportGenerator:
     def create_report(self, 
                      analysis_data: Dict,
                      image_data: str,
-                     patient_name: str = "Mr Ramzi Houidi") -> bytes:
+                     patient_name: str = "Mr Ramzi Houidi",
+                     engine: str = None,
+                     saliency: Optional[Tuple] = None,
+                     thumbnail_path: Optional[str] = None) -> bytes:
         """
         Create a medical report PDF
         
         Args:
             analysis_data: Dictionary containing analysis results
-            image_data: Base64 encoded image data
+            image_data: Base64 encoded image data (may be None when thumbnail_path is given)
             patient_name: Name of the patient
+            engine: "platypus" or "canvas"; defaults to the generator's engine
+            saliency: Optional (condition, low-resolution Grad-CAM heatmap) to overlay next to the image
+            thumbnail_path: Optional pre-rendered report-resolution JPEG used instead of image_data
             
         Returns:
             PDF file as bytes
         """
+        if (engine or self.engine) == 'canvas':
+            try:
+                return self._create_report_canvas(analysis_data, image_data, patient_name, saliency, thumbnail_path)
+            except LayoutOverflow:
+                # Content the fixed layout cannot place; let platypus flow it
+                pass
+        
         # Create PDF in memory
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter)
@@ -127,7 +145,7 @@ class MedicalReportGenerator:
         story.extend(self._create_patient_info(patient_name))
         
         # Add analysis image
-        story.extend(self._create_image_section(image_data))
+        story.extend(self._create_image_section(image_data, saliency, thumbnail_path))
         
         # Add analysis results
         story.extend(self._create_results_section(analysis_data))
@@ -150,6 +168,40 @@ class MedicalReportGenerator:
         
         return pdf_bytes
 
+    def _create_report_canvas(self, analysis_data: Dict, image_data: str, patient_name: str,
+                              saliency: Optional[Tuple] = None, thumbnail_path: Optional[str] = None) -> bytes:
+        """Render the fixed layout directly onto a canvas"""
+        caption = None
+        try:
+            pil_image = self._load_image(image_data, thumbnail_path)
+            if saliency is not None:
+                pil_image = side_by_side(pil_image, saliency[1])
+                caption = self._saliency_caption(saliency[0])
+            image_error = None
+        except Exception as e:
+            pil_image = None
+            image_error = str(e)
+        
+        return CanvasReportRenderer(self.styles).render(analysis_data, pil_image, patient_name, image_error, caption)
+
+    def _load_image(self, image_data: str, thumbnail_path: Optional[str] = None):
+        """Decode the base64 report image, or the stored thumbnail when there is one"""
+        if thumbnail_path is not None:
+            return PILImage.open(thumbnail_path)
+        if image_data is None:
+            raise ValueError("The analyzed image is no longer stored; send it with the request to include it")
+        if image_data.startswith('data:image'):
+            image_data = image_data.split(',')[1]
+        
+        image_bytes = base64.b64decode(image_data)
+        # Large JPEGs decode at a reduced scale: 4 inches at 300 DPI is all the page can show
+        return open_image(image_bytes, min_size=(1200, 1200))
+
+    @staticmethod
+    def _saliency_caption(condition: str) -> str:
+        return (f"Left: submitted image. Right: regions that most influenced the {condition} "
+                f"prediction (Grad-CAM), from blue (low) to red (high).")
+
     def _create_header(self) -> List:
         """Create company header section"""
         elements = []
@@ -206,23 +258,23 @@ class MedicalReportGenerator:
         
         return elements
 
-    def _create_image_section(self, image_data: str) -> List:
-        """Create image section"""
+    def _create_image_section(self, image_data: str, saliency: Optional[Tuple] = None,
+                              thumbnail_path: Optional[str] = None) -> List:
+        """Create image section, with the Grad-CAM overlay alongside when one is given"""
         elements = []
         
         elements.append(Paragraph("ANALYZED IMAGE", self.styles['SectionHeader']))
         
         try:
-            # Decode base64 image
-            if image_data.startswith('data:image'):
-                image_data = image_data.split(',')[1]
+            # Decode base64 image (a stored thumbnail is only opened for its header here)
+            pil_image = self._load_image(image_data, thumbnail_path)
             
-            image_bytes = base64.b64decode(image_data)
-            pil_image = PILImage.open(io.BytesIO(image_bytes))
-            
-            # Resize image to fit on page (max width 4 inches)
+            # Resize image to fit on page (max width 4 inches, 6 for the side-by-side pair)
             max_width = 4 * inch
             max_height = 3 * inch
+            if saliency is not None:
+                pil_image = side_by_side(pil_image, saliency[1])
+                max_width = 6 * inch
             
             # Calculate aspect ratio
             aspect_ratio = pil_image.width / pil_image.height
@@ -234,16 +286,23 @@ class MedicalReportGenerator:
                 height = min(max_height, pil_image.height)
                 width = height * aspect_ratio
             
-            # Convert PIL image to ReportLab image
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            reportlab_image = Image(img_buffer, width=width, height=height)
+            if thumbnail_path is not None and saliency is None:
+                # ReportLab embeds the stored JPEG as-is, with no decode or re-encode
+                reportlab_image = Image(thumbnail_path, width=width, height=height)
+            else:
+                # Convert PIL image to ReportLab image
+                img_buffer = io.BytesIO()
+                pil_image.save(img_buffer, format='PNG')
+                img_buffer.seek(0)
+                
+                reportlab_image = Image(img_buffer, width=width, height=height)
             reportlab_image.hAlign = 'CENTER'
             
             elements.append(reportlab_image)
             
+            if saliency is not None:
+                elements.append(Paragraph(self._saliency_caption(saliency[0]), self.styles['NormalText']))
+            
         except Exception as e:
             elements.append(Paragraph(f"Image could not be processed: {str(e)}", self.styles['NormalText']))
         
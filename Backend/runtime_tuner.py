@@ -0,0 +1,341 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+import torch
+from model_loader import load_classifier, read_architecture, checkpoint_version, DEFAULT_CLASSIFIER_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, concurrent workers may sweep twice
+    fcntl = None
+
+# Persisted sweep result; reused while the CPU topology and checkpoint are unchanged
+RUNTIME_TUNING_PATH = os.environ.get(
+    'RUNTIME_TUNING_PATH', os.path.join(os.path.dirname(__file__), 'runtime_tuning.json')
+)
+
+BATCH_SIZES = (1, 4, 8)
+MAX_WORKERS = 8
+# The API server keeps per-process state (crop sessions, saliency cache, pending history rows,
+# shadow evaluator), so it always runs as one process; only its threads and batch size are tuned
+SERVING_WORKERS = 1
+SWEEP_SECONDS = 1.5
+# Configurations within this fraction of the best throughput count as tied; the faster one wins
+THROUGHPUT_TOLERANCE = 0.05
+
+def _parse_cpulist(text: str) -> List[int]:
+    """Parse a kernel cpulist such as "0-3,8,10-11" """
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPUs granted by the cgroup CFS quota (v2 cpu.max or v1 cfs_quota_us), or None if unlimited"""
+    cgroup_path = '/'
+    for line in (_read('/proc/self/cgroup') or '').splitlines():
+        if line.startswith('0::'):
+            cgroup_path = line[3:] or '/'
+
+    for path in (f"/sys/fs/cgroup{cgroup_path.rstrip('/')}/cpu.max", '/sys/fs/cgroup/cpu.max'):
+        content = _read(path)
+        if content:
+            quota, period = content.split()[:2]
+            return None if quota == 'max' else int(quota) / int(period)
+
+    quota = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def detect_cpu_topology() -> Dict:
+    """Cores this process may actually use: affinity mask, capped by the cgroup quota, split by NUMA node"""
+    logical = os.cpu_count() or 1
+    affinity = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(logical))
+    quota = cgroup_cpu_quota()
+
+    # os.cpu_count() (and torch's default thread count) ignore both limits
+    available = len(affinity)
+    if quota is not None:
+        available = min(available, max(1, math.floor(quota)))
+
+    numa_nodes = []
+    node_dir = '/sys/devices/system/node'
+    if os.path.isdir(node_dir):
+        for entry in sorted(os.listdir(node_dir)):
+            if entry.startswith('node') and entry[4:].isdigit():
+                cpus = [cpu for cpu in _parse_cpulist(_read(os.path.join(node_dir, entry, 'cpulist')) or '') if cpu in affinity]
+                if cpus:
+                    numa_nodes.append(cpus)
+    if not numa_nodes:
+        numa_nodes = [affinity]
+
+    return {
+        'logical_cpus': logical,
+        'affinity_cpus': len(affinity),
+        'cgroup_quota': quota,
+        'available_cpus': available,
+        'numa_nodes': len(numa_nodes),
+        'numa_cpus': numa_nodes,
+    }
+
+def candidate_configs(topology: Dict, max_workers: int = MAX_WORKERS) -> List[Dict]:
+    """Worker/thread splits that fill the available cores without oversubscribing them"""
+    available = topology['available_cpus']
+    nodes = topology['numa_nodes']
+
+    worker_counts = {1, available, nodes}
+    workers = 2
+    while workers < available:
+        worker_counts.add(workers)
+        workers *= 2
+
+    configs = []
+    for workers in sorted(w for w in worker_counts if 1 <= w <= min(available, max_workers)):
+        configs.append({'workers': workers, 'threads': max(1, available // workers)})
+    return configs
+
+def fingerprint(topology: Dict, checkpoint_path: str, max_workers: int) -> Dict:
+    """What a persisted result depends on; any change triggers a new sweep"""
+    return {
+        'max_workers': max_workers,
+        'available_cpus': topology['available_cpus'],
+        'numa_nodes': topology['numa_nodes'],
+        'checkpoint': checkpoint_version(checkpoint_path),
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'throughput_tolerance': THROUGHPUT_TOLERANCE,
+    }
+
+def _worker_cpus(topology: Dict, index: int, workers: int) -> Optional[List[int]]:
+    """Pin worker i to one NUMA node when workers split evenly across nodes"""
+    nodes = topology['numa_cpus']
+    if len(nodes) > 1 and workers % len(nodes) == 0:
+        return nodes[index % len(nodes)]
+    return None
+
+def _bench_worker(args):
+    """Child process: load the model with the given threads, then time each batch size on "go" """
+    if args.cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, _parse_cpulist(args.cpus))
+    torch.set_num_threads(args.threads)
+    torch.set_num_interop_threads(1)
+
+    model = load_classifier(args.checkpoint, args.num_classes, torch.device('cpu'))
+    image_size = read_architecture(args.checkpoint)['image_size']
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            model(torch.randn(batch_size, 3, image_size, image_size))
+    print('ready', flush=True)
+
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            sys.stdin.readline()
+            inputs = torch.randn(batch_size, 3, image_size, image_size)
+            latencies = []
+            start = time.perf_counter()
+            while time.perf_counter() - start < args.duration:
+                batch_start = time.perf_counter()
+                model(inputs)
+                latencies.append((time.perf_counter() - batch_start) * 1000)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({
+                'batch_size': batch_size,
+                'images_per_sec': len(latencies) * batch_size / elapsed,
+                'p50_batch_ms': float(np.percentile(latencies, 50)),
+                'p95_batch_ms': float(np.percentile(latencies, 95)),
+            }), flush=True)
+
+def benchmark_config(config: Dict, topology: Dict, checkpoint_path: str, num_classes: int,
+                     batch_sizes=BATCH_SIZES, duration: float = SWEEP_SECONDS) -> List[Dict]:
+    """Run `workers` processes concurrently and measure aggregate throughput per batch size"""
+    processes = []
+    for index in range(config['workers']):
+        command = [
+            sys.executable, os.path.abspath(__file__), '--bench-worker',
+            '--checkpoint', checkpoint_path,
+            '--num-classes', str(num_classes),
+            '--threads', str(config['threads']),
+            '--batch-sizes', ','.join(str(size) for size in batch_sizes),
+            '--duration', str(duration),
+        ]
+        cpus = _worker_cpus(topology, index, config['workers'])
+        if cpus:
+            command += ['--cpus', ','.join(str(cpu) for cpu in cpus)]
+        processes.append(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+
+    results = []
+    try:
+        for process in processes:
+            if process.stdout.readline().strip() != 'ready':
+                raise RuntimeError(f"benchmark worker exited with code {process.wait()}")
+
+        for batch_size in batch_sizes:
+            # Release every worker at once so they contend for the cores as real workers would
+            for process in processes:
+                process.stdin.write('go\n')
+                process.stdin.flush()
+            measurements = [json.loads(process.stdout.readline()) for process in processes]
+            results.append({
+                **config,
+                'batch_size': batch_size,
+                'images_per_sec': round(sum(m['images_per_sec'] for m in measurements), 2),
+                'p50_batch_ms': round(max(m['p50_batch_ms'] for m in measurements), 2),
+                'p95_batch_ms': round(max(m['p95_batch_ms'] for m in measurements), 2),
+            })
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+    return results
+
+def choose_config(results: List[Dict], max_latency_ms: Optional[float] = None,
+                  tolerance: float = THROUGHPUT_TOLERANCE) -> Dict:
+    """Lowest median latency among configs within `tolerance` of the best throughput
+
+    Only configs within the p95 latency budget are considered, if any meet it. Without the
+    tie-break a larger batch that is 1% faster overall would win at several times the latency.
+    """
+    eligible = results
+    if max_latency_ms is not None:
+        eligible = [r for r in results if r['p95_batch_ms'] <= max_latency_ms] or results
+    best = max(r['images_per_sec'] for r in eligible)
+    tied = [r for r in eligible if r['images_per_sec'] >= best * (1 - tolerance)]
+    return min(tied, key=lambda r: (r['p50_batch_ms'], -r['images_per_sec']))
+
+def sweep(checkpoint_path: str, num_classes: int, topology: Dict, max_latency_ms: Optional[float] = None,
+          max_workers: int = MAX_WORKERS) -> Dict:
+    """Benchmark every candidate configuration and pick the best"""
+    results = []
+    for config in candidate_configs(topology, max_workers):
+        print(f"Runtime tuning: {config['workers']} worker(s) x {config['threads']} thread(s)...")
+        results.extend(benchmark_config(config, topology, checkpoint_path, num_classes))
+
+    best = choose_config(results, max_latency_ms)
+    return {
+        'workers': best['workers'],
+        'threads': best['threads'],
+        'interop_threads': 1,
+        'batch_size': best['batch_size'],
+        'images_per_sec': best['images_per_sec'],
+        'p50_batch_ms': best['p50_batch_ms'],
+        'p95_batch_ms': best['p95_batch_ms'],
+        'results': results,
+    }
+
+def default_config(topology: Dict) -> Dict:
+    """Untuned fallback: one worker using every available core"""
+    return {'workers': 1, 'threads': topology['available_cpus'], 'interop_threads': 1, 'batch_size': 8}
+
+@contextmanager
+def _tuning_lock(path: str):
+    """Serialize sweeps so concurrent workers wait for one result instead of benchmarking each other"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_or_tune(checkpoint_path: str = DEFAULT_CLASSIFIER_PATH, num_classes: int = 5,
+                 path: str = RUNTIME_TUNING_PATH, force: bool = False, max_workers: int = SERVING_WORKERS) -> Dict:
+    """Return the persisted configuration for this machine, running the sweep first if needed"""
+    topology = detect_cpu_topology()
+    if os.environ.get('RUNTIME_TUNING', '1') == '0' or not os.path.exists(checkpoint_path):
+        return {**default_config(topology), 'source': 'default', 'topology': topology}
+
+    key = fingerprint(topology, checkpoint_path, max_workers)
+    with _tuning_lock(path):
+        if not force and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('fingerprint') == key:
+                return {**saved['config'], 'source': 'cached', 'topology': topology}
+
+        max_latency = os.environ.get('RUNTIME_TUNING_MAX_LATENCY_MS')
+        config = sweep(checkpoint_path, num_classes, topology, float(max_latency) if max_latency else None, max_workers)
+        with open(path, 'w') as f:
+            json.dump({
+                'fingerprint': key,
+                'tuned_at': datetime.now().isoformat(),
+                'topology': topology,
+                'config': config,
+            }, f, indent=2)
+        print(f"Runtime tuning saved to {path}")
+        return {**config, 'source': 'sweep', 'topology': topology}
+
+def apply_config(config: Dict, concurrent_forwards: int = 1) -> int:
+    """Set this process's torch thread pools to the tuned sizes; returns the intra-op thread count
+
+    The sweep times one forward pass at a time per worker. A worker that runs
+    `concurrent_forwards` passes at once (scheduler slots) splits its cores between them
+    instead of giving each the full count and oversubscribing the CPU.
+    """
+    threads = max(1, config['threads'] // max(1, concurrent_forwards))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(config['interop_threads'])
+    except RuntimeError:
+        # Only allowed before the first inter-op parallel work; keep torch's default then
+        pass
+    return threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker/thread/batch configurations for this machine")
+    parser.add_argument('--checkpoint', default=DEFAULT_CLASSIFIER_PATH)
+    parser.add_argument('--num-classes', type=int, default=5)
+    parser.add_argument('--force', action='store_true', help="Re-run the sweep even if a result is cached")
+    parser.add_argument('--max-workers', type=int, default=SERVING_WORKERS,
+                        help="Also compare multi-process splits (the API server itself always runs one process)")
+    parser.add_argument('--bench-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--threads', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--batch-sizes', default=','.join(str(size) for size in BATCH_SIZES), help=argparse.SUPPRESS)
+    parser.add_argument('--duration', type=float, default=SWEEP_SECONDS, help=argparse.SUPPRESS)
+    parser.add_argument('--cpus', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bench_worker:
+        _bench_worker(args)
+        return
+
+    config = load_or_tune(args.checkpoint, args.num_classes, force=args.force, max_workers=args.max_workers)
+    topology = config['topology']
+    print(f"CPUs: {topology['available_cpus']} available ({topology['logical_cpus']} logical, "
+          f"affinity {topology['affinity_cpus']}, quota {topology['cgroup_quota']}, "
+          f"{topology['numa_nodes']} NUMA node(s))")
+    for result in config.get('results', []):
+        print(f"  {result['workers']} x {result['threads']} threads, batch {result['batch_size']:<2} "
+              f"{result['images_per_sec']:8.1f} img/s  p50 {result['p50_batch_ms']:7.1f} ms  p95 {result['p95_batch_ms']:7.1f} ms")
+    print(f"Chosen ({config['source']}): {config['workers']} worker(s) x {config['threads']} thread(s), "
+          f"batch {config['batch_size']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import json
+import queue
+import random
+import threading
+import time
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+import torch
+from model_loader import load_classifier, read_architecture, eval_transform, checkpoint_version
+from image_guard import open_image
+
+def shadow_worker(checkpoint_path: str, num_classes: int, cpu_budget: float, inputs, outputs):
+    """Child process: classify mirrored uploads with the candidate at the lowest CPU priority
+
+    One torch thread, nice 19, and after every sample an idle period sized so the process
+    averages at most `cpu_budget` of one core.
+    """
+    if hasattr(os, 'nice'):
+        os.nice(19)
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+
+    model = load_classifier(checkpoint_path, num_classes, torch.device('cpu'))
+    image_size = read_architecture(checkpoint_path)['image_size']
+    transform = eval_transform(image_size)
+    outputs.put(('ready', checkpoint_version(checkpoint_path)))
+
+    while True:
+        item = inputs.get()
+        if item is None:
+            break
+        sample_id, image_bytes = item
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        try:
+            image = open_image(image_bytes, (image_size, image_size)).convert('RGB')
+            with torch.no_grad():
+                probabilities = torch.softmax(model(transform(image).unsqueeze(0)), dim=1)[0].numpy()
+            error = None
+        except Exception as e:
+            probabilities = None
+            error = str(e)
+        latency_ms = (time.perf_counter() - start) * 1000
+        cpu_seconds = time.process_time() - cpu_start
+
+        outputs.put((sample_id, probabilities, latency_ms, cpu_seconds, error))
+        time.sleep(cpu_seconds * (1 / cpu_budget - 1))
+
+class ShadowEvaluator:
+    """Mirror a sample of live classifications to a candidate model and compare the answers
+
+    submit() is non-blocking: a sample is dropped rather than queued when the shadow process
+    is behind, so the serving path never waits on it. Results are aggregated here and every
+    compared sample is appended to a JSONL log.
+    """
+
+    def __init__(self, checkpoint_path: str, class_names: List[str], sample_rate: float = 0.1,
+                 cpu_budget: float = 0.25, max_pending: int = 4, log_path: Optional[str] = None,
+                 log_max_bytes: int = 50 * 1024 * 1024):
+        self.checkpoint_path = checkpoint_path
+        self.class_names = class_names
+        self.sample_rate = sample_rate
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.version = None
+
+        context = multiprocessing.get_context('spawn')
+        self._inputs = context.Queue(maxsize=max_pending)
+        self._outputs = context.Queue()
+        self._process = context.Process(
+            target=shadow_worker,
+            args=(checkpoint_path, len(class_names), self.cpu_budget, self._inputs, self._outputs),
+            name="shadow-model",
+            daemon=True
+        )
+        self._collector = None
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._latency_deltas = deque(maxlen=1000)
+
+        self.seen = 0
+        self.sampled = 0
+        self.dropped = 0
+        self.compared = 0
+        self.agreements = 0
+        self.errors = 0
+        self.confusion = {}
+        self.abs_diff_total = 0.0
+        self.serving_ms_total = 0.0
+        self.candidate_ms_total = 0.0
+        self.candidate_cpu_seconds = 0.0
+        self.started_at = None
+
+    def start(self):
+        self._process.start()
+        self.started_at = time.monotonic()
+        self._collector = threading.Thread(target=self._collect, name="shadow-collector", daemon=True)
+        self._collector.start()
+
+    def stop(self, timeout: float = 5.0):
+        try:
+            self._inputs.put_nowait(None)
+        except queue.Full:
+            pass
+        # stop() also runs when startup failed before start(); an unstarted process cannot be joined
+        if self._process.pid is not None:
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._outputs.put(None)
+        if self._collector is not None:
+            self._collector.join(timeout)
+
+    def submit(self, image_bytes: bytes, image_hash: str, probabilities: np.ndarray,
+               serving_ms: float, serving_version: str):
+        """Maybe mirror one classification; returns immediately either way"""
+        with self._lock:
+            self.seen += 1
+            if self.version is None or random.random() >= self.sample_rate:
+                return
+            self.sampled += 1
+            sample_id = self._next_id
+            self._next_id += 1
+            self._pending[sample_id] = (image_hash, probabilities, serving_ms, serving_version)
+        try:
+            self._inputs.put_nowait((sample_id, image_bytes))
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(sample_id, None)
+                self.dropped += 1
+
+    def _collect(self):
+        while True:
+            item = self._outputs.get()
+            if item is None:
+                return
+            if item[0] == 'ready':
+                self.version = item[1]
+                print(f"Shadow model {self.version} ready (sampling {self.sample_rate:.0%}, "
+                      f"CPU budget {self.cpu_budget:.0%} of one core)")
+                continue
+            self._record(*item)
+
+    def _record(self, sample_id: int, candidate: Optional[np.ndarray], candidate_ms: float,
+                cpu_seconds: float, error: Optional[str]):
+        with self._lock:
+            pending = self._pending.pop(sample_id, None)
+            self.candidate_cpu_seconds += cpu_seconds
+            if pending is None:
+                return
+            image_hash, serving, serving_ms, serving_version = pending
+            if candidate is None:
+                self.errors += 1
+                return
+
+            serving_label = self.class_names[int(np.argmax(serving))]
+            candidate_label = self.class_names[int(np.argmax(candidate))]
+            agree = serving_label == candidate_label
+            abs_diff = float(np.max(np.abs(candidate - serving)))
+
+            self.compared += 1
+            self.agreements += agree
+            if not agree:
+                key = f"{serving_label} -> {candidate_label}"
+                self.confusion[key] = self.confusion.get(key, 0) + 1
+            self.abs_diff_total += abs_diff
+            self.serving_ms_total += serving_ms
+            self.candidate_ms_total += candidate_ms
+            self._latency_deltas.append(candidate_ms - serving_ms)
+
+        if self.log_path:
+            self._log({
+                'timestamp': datetime.now().isoformat(),
+                'image_hash': image_hash,
+                'serving_version': serving_version,
+                'candidate_version': self.version,
+                'serving_condition': serving_label,
+                'candidate_condition': candidate_label,
+                'agree': agree,
+                'max_abs_probability_diff': round(abs_diff, 4),
+                'serving_ms': round(serving_ms, 2),
+                'candidate_ms': round(candidate_ms, 2),
+            })
+
+    def _log(self, entry: Dict):
+        # Keep one rotated generation so the log stays bounded
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > self.log_max_bytes:
+            os.replace(self.log_path, self.log_path + '.1')
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            deltas = sorted(self._latency_deltas)
+            uptime = time.monotonic() - self.started_at if self.started_at else 0.0
+            return {
+                'checkpoint': self.checkpoint_path,
+                'candidate_version': self.version,
+                'ready': self.version is not None,
+                'sample_rate': self.sample_rate,
+                'cpu_budget': self.cpu_budget,
+                'seen': self.seen,
+                'sampled': self.sampled,
+                'dropped_busy': self.dropped,
+                'compared': self.compared,
+                'errors': self.errors,
+                'agreement_rate': self.agreements / self.compared if self.compared else None,
+                'disagreements': dict(sorted(self.confusion.items(), key=lambda item: -item[1])),
+                'mean_max_abs_probability_diff': self.abs_diff_total / self.compared if self.compared else None,
+                'avg_serving_ms': self.serving_ms_total / self.compared if self.compared else None,
+                # The candidate runs single-threaded at idle priority, so its latency is an upper bound
+                'avg_candidate_ms': self.candidate_ms_total / self.compared if self.compared else None,
+                'latency_delta_ms': {
+                    'p50': deltas[len(deltas) // 2],
+                    'p95': deltas[min(int(len(deltas) * 0.95), len(deltas) - 1)],
+                } if deltas else None,
+                'candidate_cpu_share': self.candidate_cpu_seconds / uptime if uptime else 0.0,
+                'log_path': self.log_path,
+            }
@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+class StreamSession:
+    """Per-connection state for live frame classification"""
+
+    def __init__(self, session_id: int, profile: str, smoothing: float,
+                 send: Callable[[Dict], Awaitable[None]]):
+        self.session_id = session_id
+        self.profile = profile
+        # EMA weight of the newest frame; 1.0 disables smoothing
+        self.smoothing = min(max(smoothing, 0.01), 1.0)
+        self.send = send
+
+        self.pending: Optional[bytes] = None
+        self.pending_seq = 0
+        self.pending_received_at = 0.0
+        self.seq = 0
+        self.smoothed: Optional[np.ndarray] = None
+
+        self.frames_received = 0
+        self.frames_classified = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0
+
+    def push(self, frame: bytes) -> bool:
+        """Store the newest frame, replacing one that has not reached the model yet"""
+        self.seq += 1
+        self.frames_received += 1
+        replaced = self.pending is not None
+        if replaced:
+            self.frames_dropped += 1
+        self.pending = frame
+        self.pending_seq = self.seq
+        self.pending_received_at = time.perf_counter()
+        return replaced
+
+    def take(self) -> Tuple[int, bytes, float]:
+        frame = (self.pending_seq, self.pending, self.pending_received_at)
+        self.pending = None
+        return frame
+
+    def update(self, probabilities: np.ndarray) -> np.ndarray:
+        """Fold a new probability vector into the temporally smoothed one"""
+        if self.smoothed is None:
+            self.smoothed = probabilities
+        else:
+            self.smoothed = self.smoothing * probabilities + (1 - self.smoothing) * self.smoothed
+        return self.smoothed
+
+    def reset(self):
+        self.smoothed = None
+
+class StreamBatcher:
+    """Batches the latest frame of every live connection into shared forward passes
+
+    Each connection holds at most one pending frame (latest-frame-wins); when a batch
+    is in flight, newer frames simply replace older pending ones, so a slow model makes
+    clients skip frames instead of building a backlog.
+    """
+
+    def __init__(self, infer: Callable[[List[Tuple[str, bytes]]], List], class_names: list,
+                 submit: Optional[Callable[..., Awaitable]] = None, max_batch: int = 8):
+        # infer receives [(profile, frame_bytes)] and returns one probability vector or exception per frame
+        self.infer = infer
+        self.class_names = class_names
+        self.submit = submit
+        self.max_batch = max(1, max_batch)
+
+        self._sessions = deque()
+        self._next_id = 0
+        self._ready = None
+        self._task = None
+        # The loop only keeps weak references to tasks; these are held until they finish
+        self._deliveries = set()
+
+        self.batches = 0
+        self.frames_batched = 0
+        self.total_batch_ms = 0.0
+
+    async def start(self):
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._deliveries):
+            task.cancel()
+
+    def open_session(self, profile: str, smoothing: float, send: Callable[[Dict], Awaitable[None]]) -> StreamSession:
+        self._next_id += 1
+        session = StreamSession(self._next_id, profile, smoothing, send)
+        self._sessions.append(session)
+        return session
+
+    def close_session(self, session: StreamSession):
+        try:
+            self._sessions.remove(session)
+        except ValueError:
+            pass
+
+    def push(self, session: StreamSession, frame: bytes):
+        session.push(frame)
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+
+            # Take the latest frame from up to max_batch connections, rotating so no one starves
+            batch = []
+            for _ in range(len(self._sessions)):
+                session = self._sessions[0]
+                self._sessions.rotate(-1)
+                if session.pending is not None:
+                    batch.append((session, session.take()))
+                    if len(batch) >= self.max_batch:
+                        break
+
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            frames = [(session.profile, frame) for session, (_, frame, _) in batch]
+            try:
+                if self.submit is not None:
+                    results = await self.submit(self.infer, frames)
+                else:
+                    results = self.infer(frames)
+            except Exception as e:
+                results = [e] * len(batch)
+            batch_ms = (time.perf_counter() - start) * 1000
+
+            self.batches += 1
+            self.frames_batched += len(batch)
+            self.total_batch_ms += batch_ms
+
+            for (session, (seq, _, received_at)), result in zip(batch, results):
+                if session not in self._sessions:
+                    continue
+                task = asyncio.create_task(self._deliver(session, seq, received_at, result, len(batch)))
+                self._deliveries.add(task)
+                task.add_done_callback(self._delivery_done)
+
+            # Frames that arrived during the forward pass are waiting already
+            if any(session.pending is not None for session in self._sessions):
+                self._ready.set()
+
+    def _delivery_done(self, task: asyncio.Task):
+        self._deliveries.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error delivering stream prediction: {str(task.exception())}")
+
+    async def _deliver(self, session: StreamSession, seq: int, received_at: float, result, batch_size: int):
+        if isinstance(result, Exception):
+            session.frames_failed += 1
+            message = {"type": "error", "frame": seq, "detail": str(getattr(result, 'detail', result))}
+        else:
+            session.frames_classified += 1
+            smoothed = session.update(result)
+            primary = int(np.argmax(smoothed))
+            message = {
+                "type": "prediction",
+                "frame": seq,
+                "predictions": {name: float(smoothed[i]) for i, name in enumerate(self.class_names)},
+                "frame_predictions": {name: float(result[i]) for i, name in enumerate(self.class_names)},
+                "primary_condition": self.class_names[primary],
+                "confidence": float(smoothed[primary]),
+                "latency_ms": (time.perf_counter() - received_at) * 1000,
+                "batch_size": batch_size,
+                "frames_dropped": session.frames_dropped,
+            }
+
+        try:
+            await session.send(message)
+        except Exception:
+            # The connection is closing; its receive loop will clean up the session
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            'connections': len(self._sessions),
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'frames_batched': self.frames_batched,
+            'avg_batch_size': self.frames_batched / self.batches if self.batches else 0.0,
+            'avg_batch_ms': self.total_batch_ms / self.batches if self.batches else 0.0,
+            'frames_dropped': sum(session.frames_dropped for session in self._sessions),
+        }
@@ -2,6 +2,7 @@ import requests
 import base64
 import json
 import os
+import time
 from datetime import datetime
 
 # API base URL
@@ -23,6 +24,25 @@ def test_health_check():
         print(f"❌ Health check error: {e}")
         return False
 
+def test_readiness(timeout: float = 120):
+    """Wait for the model to finish loading in the background"""
+    print("\nWaiting for readiness...")
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            response = requests.get(f"{API_BASE_URL}/ready")
+            data = response.json()
+            if response.status_code == 200:
+                print(f"✅ Ready: {data['timings_ms']}")
+                return True
+            if data.get('error') or time.monotonic() > deadline:
+                print(f"❌ Not ready: {data}")
+                return False
+            time.sleep(1)
+    except Exception as e:
+        print(f"❌ Readiness error: {e}")
+        return False
+
 def test_model_info():
     """Test the model info endpoint"""
     print("\nTesting model info...")
@@ -203,6 +223,188 @@ def test_classification_with_real_image(image_path):
         print(f"❌ Classification error: {e}")
         return None
 
+def test_analysis_history(classification_result):
+    """Test that classifications are stored and retrievable from the history store"""
+    print("\nTesting analysis history...")
+    
+    if not classification_result or not classification_result.get('analysis_id'):
+        print("❌ No analysis_id available for history testing")
+        return False
+    
+    analysis_id = classification_result['analysis_id']
+    
+    try:
+        # Writes are batched in the background, but an id is readable as soon as it is returned
+        response = requests.get(f"{API_BASE_URL}/history/{analysis_id}")
+        
+        if response.status_code != 200:
+            print(f"❌ Analysis {analysis_id} not found in history: {response.status_code}")
+            return False
+        
+        record = response.json()
+        page = requests.get(f"{API_BASE_URL}/history", params={"limit": 5}).json()
+        print(f"✅ Stored analysis: {record['primary_condition']} ({record['model_version']})")
+        print(f"History page: {len(page['items'])} items, next_cursor={page['next_cursor']}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Analysis history error: {e}")
+        return False
+
+def test_ingestion_guard():
+    """Test that unsupported uploads are rejected before decoding"""
+    print("\nTesting ingestion guard...")
+    
+    from PIL import Image
+    import io
+    
+    # GIF is not an accepted format, so the header probe should reject it with 415
+    test_image = Image.new('RGB', (100, 100), color='red')
+    buffer = io.BytesIO()
+    test_image.save(buffer, format='GIF')
+    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/classify",
+            json={"image": f"data:image/gif;base64,{image_base64}"},
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if response.status_code == 415:
+            stats = requests.get(f"{API_BASE_URL}/ingest-stats").json()
+            print(f"✅ Unsupported format rejected: {response.json()['detail']}")
+            print(f"Ingest stats: {stats}")
+            return True
+        else:
+            print(f"❌ Expected 415, got {response.status_code}")
+            print(f"Response: {response.text}")
+            return False
+            
+    except Exception as e:
+        print(f"❌ Ingestion guard error: {e}")
+        return False
+
+def test_explanation():
+    """Test Grad-CAM heatmaps on classify and their reuse in the report"""
+    print("\nTesting Grad-CAM explanation...")
+    
+    from PIL import Image
+    import io
+    
+    test_image = Image.new('RGB', (100, 100), color='red')
+    buffer = io.BytesIO()
+    test_image.save(buffer, format='PNG')
+    image_data_url = f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+    
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/classify",
+            json={"image": image_data_url, "explain": True, "explain_top_k": 2},
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if response.status_code != 200 or not response.json().get('heatmaps'):
+            print(f"❌ Explanation failed: {response.status_code}")
+            print(f"Response: {response.text}")
+            return False
+        
+        heatmaps = response.json()['heatmaps']
+        print(f"✅ Heatmaps for: {', '.join(heatmaps)} ({len(next(iter(heatmaps.values())))} px square)")
+        
+        # The report for the same image should overlay the cached heatmap without recomputing it
+        report = requests.post(
+            f"{API_BASE_URL}/generate-report",
+            json={"image": image_data_url, "analysis_data": response.json()}
+        )
+        stats = requests.get(f"{API_BASE_URL}/saliency-stats").json()
+        print(f"Report with heatmap: {report.status_code}, saliency cache: {stats}")
+        return report.status_code == 200 and stats['hits'] > 0
+        
+    except Exception as e:
+        print(f"❌ Explanation error: {e}")
+        return False
+
+def test_blob_store():
+    """Test uploading an image once and classifying/reporting it by blob id"""
+    print("\nTesting blob store...")
+    
+    from PIL import Image
+    import io
+    
+    test_image = Image.new('RGB', (100, 100), color='blue')
+    buffer = io.BytesIO()
+    test_image.save(buffer, format='PNG')
+    image_data_url = f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+    
+    try:
+        first = requests.post(f"{API_BASE_URL}/blobs", json={"image": image_data_url})
+        second = requests.post(f"{API_BASE_URL}/blobs", json={"image": image_data_url})
+        if first.status_code != 200 or second.status_code != 200:
+            print(f"❌ Blob upload failed: {first.status_code}")
+            print(f"Response: {first.text}")
+            return False
+        
+        blob_id = first.json()['blob_id']
+        print(f"✅ Stored blob {blob_id[:12]}... (repeat upload created: {second.json()['created']})")
+        
+        response = requests.post(f"{API_BASE_URL}/classify", json={"blob_id": blob_id})
+        if response.status_code != 200:
+            print(f"❌ Classification by blob id failed: {response.status_code}")
+            print(f"Response: {response.text}")
+            return False
+        
+        report = requests.post(
+            f"{API_BASE_URL}/generate-report",
+            json={"blob_id": blob_id, "analysis_data": response.json()}
+        )
+        stats = requests.get(f"{API_BASE_URL}/blob-stats").json()
+        print(f"Report from blob: {report.status_code}, blob store: {stats}")
+        return report.status_code == 200 and not second.json()['created']
+        
+    except Exception as e:
+        print(f"❌ Blob store error: {e}")
+        return False
+
+def test_crop_session():
+    """Test uploading an image once and classifying several crops of it by rectangle"""
+    print("\nTesting crop session...")
+    
+    from PIL import Image
+    import io
+    
+    test_image = Image.new('RGB', (400, 300), color='green')
+    buffer = io.BytesIO()
+    test_image.save(buffer, format='JPEG')
+    image_data_url = f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+    
+    try:
+        session = requests.post(f"{API_BASE_URL}/sessions", json={"image": image_data_url})
+        if session.status_code != 200:
+            print(f"❌ Session creation failed: {session.status_code}")
+            print(f"Response: {session.text}")
+            return False
+        
+        session_id = session.json()['session_id']
+        crops = [{"x": 0, "y": 0, "width": 200, "height": 200}, {"x": 100, "y": 50, "width": 250, "height": 250}]
+        response = requests.post(f"{API_BASE_URL}/sessions/{session_id}/classify", json={"crops": crops})
+        if response.status_code != 200 or len(response.json()['results']) != len(crops):
+            print(f"❌ Crop classification failed: {response.status_code}")
+            print(f"Response: {response.text}")
+            return False
+        
+        # Crop classifications are recorded in the history like any other
+        analysis_id = response.json()['results'][0]['analysis_id']
+        stored = requests.get(f"{API_BASE_URL}/history/{analysis_id}")
+        deleted = requests.delete(f"{API_BASE_URL}/sessions/{session_id}")
+        print(f"✅ Classified {len(crops)} crops: {[r['primary_condition'] for r in response.json()['results']]}")
+        print(f"Stored crop analysis: {stored.status_code}, session deleted: {deleted.status_code}")
+        return stored.status_code == 200 and deleted.status_code == 200
+        
+    except Exception as e:
+        print(f"❌ Crop session error: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("🧪 Testing MedicImage API")
@@ -211,6 +413,9 @@ def main():
     # Test health check
     health_ok = test_health_check()
     
+    # Wait until the model has loaded
+    ready_ok = test_readiness()
+    
     # Test model info
     model_ok = test_model_info()
     
@@ -232,6 +437,21 @@ def main():
         
         report_ok = test_report_generation(classification_result, image_data_url)
     
+    # Test analysis history
+    history_ok = test_analysis_history(classification_result)
+    
+    # Test ingestion guard
+    guard_ok = test_ingestion_guard()
+    
+    # Test Grad-CAM explanation
+    explain_ok = test_explanation()
+    
+    # Test blob store
+    blob_ok = test_blob_store()
+    
+    # Test crop sessions
+    session_ok = test_crop_session()
+    
     # Test with real image if available
     test_images = [
         "test_image.jpg",
@@ -254,13 +474,19 @@ def main():
     print("\n" + "=" * 50)
     print("📊 Test Summary:")
     print(f"Health Check: {'✅ PASS' if health_ok else '❌ FAIL'}")
+    print(f"Readiness: {'✅ PASS' if ready_ok else '❌ FAIL'}")
     print(f"Model Info: {'✅ PASS' if model_ok else '❌ FAIL'}")
     print(f"Dummy Image Classification: {'✅ PASS' if dummy_ok else '❌ FAIL'}")
     print(f"Report Generation: {'✅ PASS' if report_ok else '❌ FAIL'}")
+    print(f"Analysis History: {'✅ PASS' if history_ok else '❌ FAIL'}")
+    print(f"Ingestion Guard: {'✅ PASS' if guard_ok else '❌ FAIL'}")
+    print(f"Grad-CAM Explanation: {'✅ PASS' if explain_ok else '❌ FAIL'}")
+    print(f"Blob Store: {'✅ PASS' if blob_ok else '❌ FAIL'}")
+    print(f"Crop Session: {'✅ PASS' if session_ok else '❌ FAIL'}")
     if any(os.path.exists(img) for img in test_images):
         print(f"Real Image Classification: {'✅ PASS' if real_image_ok else '❌ FAIL'}")
     
-    all_tests_passed = health_ok and model_ok and dummy_ok and report_ok
+    all_tests_passed = health_ok and ready_ok and model_ok and dummy_ok and report_ok and history_ok and guard_ok and explain_ok and blob_ok and session_ok
     if real_image_ok is not None:
         all_tests_passed = all_tests_passed and real_image_ok
     
@@ -4,10 +4,12 @@ import 'react-image-crop/dist/ReactCrop.css';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Crop as CropIcon, RotateCcw } from 'lucide-react';
+import { CropRect } from '@/services/api';
 
 interface ImageCropperProps {
   imageSrc: string;
-  onCropComplete: (croppedImage: string) => void;
+  // cropRect is in original image pixels, ready for apiService.classifyCrops
+  onCropComplete: (croppedImage: string, cropRect: CropRect) => void;
   onCancel: () => void;
 }
 
@@ -59,12 +61,23 @@ const ImageCropper: React.FC<ImageCropperProps> = ({ imageSrc, onCropComplete, o
     });
   };
 
+  const toImagePixels = (image: HTMLImageElement, crop: PixelCrop): CropRect => {
+    const scaleX = image.naturalWidth / image.width;
+    const scaleY = image.naturalHeight / image.height;
+    return {
+      x: Math.round(crop.x * scaleX),
+      y: Math.round(crop.y * scaleY),
+      width: Math.round(crop.width * scaleX),
+      height: Math.round(crop.height * scaleY),
+    };
+  };
+
   const handleCropComplete = async () => {
     if (!completedCrop || !imgRef.current) return;
 
     try {
       const croppedImage = await getCroppedImg(imgRef.current, completedCrop);
-      onCropComplete(croppedImage);
+      onCropComplete(croppedImage, toImagePixels(imgRef.current, completedCrop));
     } catch (error) {
       console.error('Error cropping image:', error);
     }
@@ -6,12 +6,13 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/com
 import { Progress } from "@/components/ui/progress";
 import { User, ArrowUp, FileImage, AlertCircle, CheckCircle, Info, FileText } from "lucide-react";
 import ImageCropper from "@/components/ImageCropper";
-import apiService, { ClassificationResult } from "@/services/api";
+import apiService, { ClassificationResult, CropRect } from "@/services/api";
 import { toast } from "sonner";
 
 const DermaScan = () => {
   const [selectedImage, setSelectedImage] = useState<string | null>(null);
   const [croppedImage, setCroppedImage] = useState<string | null>(null);
+  const [cropRect, setCropRect] = useState<CropRect | null>(null);
   const [showCropper, setShowCropper] = useState(false);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [isGeneratingReport, setIsGeneratingReport] = useState(false);
@@ -21,6 +22,8 @@ const DermaScan = () => {
   const [apiConnected, setApiConnected] = useState<boolean | null>(null);
   const [showDisclaimer, setShowDisclaimer] = useState(false);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  // Crop session holding the uploaded image server-side, so re-crops only send a rectangle
+  const sessionIdRef = useRef<string | null>(null);
 
   // Check API connection on component mount
   useEffect(() => {
@@ -38,13 +41,43 @@ const DermaScan = () => {
     checkApiConnection();
   }, []);
 
+  // Release the crop session when leaving the page
+  useEffect(() => {
+    return () => closeCropSession();
+  }, []);
+
+  const closeCropSession = () => {
+    if (sessionIdRef.current) {
+      apiService.deleteCropSession(sessionIdRef.current).catch(() => {});
+      sessionIdRef.current = null;
+    }
+  };
+
+  const classifyCrop = async (imageData: string, rect: CropRect): Promise<ClassificationResult> => {
+    // Upload the full image once per selected image; a failed call retries once with a fresh
+    // session in case the old one expired
+    for (let attempt = 0; ; attempt++) {
+      const sessionId = sessionIdRef.current ?? (await apiService.createCropSession(imageData)).session_id;
+      sessionIdRef.current = sessionId;
+      try {
+        const { results } = await apiService.classifyCrops(sessionId, [rect]);
+        return results[0];
+      } catch (error) {
+        sessionIdRef.current = null;
+        if (attempt > 0) throw error;
+      }
+    }
+  };
+
   const handleImageUpload = (event: React.ChangeEvent<HTMLInputElement>) => {
     const file = event.target.files?.[0];
     if (file) {
       const reader = new FileReader();
       reader.onload = (e) => {
+        closeCropSession();
         setSelectedImage(e.target?.result as string);
         setCroppedImage(null);
+        setCropRect(null);
         setAnalysisComplete(false);
         setClassificationResult(null);
       };
@@ -52,13 +85,14 @@ const DermaScan = () => {
     }
   };
 
-  const handleCropComplete = (croppedImageData: string) => {
+  const handleCropComplete = (croppedImageData: string, rect: CropRect) => {
     setCroppedImage(croppedImageData);
+    setCropRect(rect);
     setShowCropper(false);
   };
 
   const handleAnalyze = async () => {
-    if (!croppedImage) {
+    if (!croppedImage || !cropRect || !selectedImage) {
       toast.error('Please crop the image first');
       return;
     }
@@ -83,8 +117,8 @@ const DermaScan = () => {
         });
       }, 200);
 
-      // Make API call to classify the image
-      const result = await apiService.classifyImage(croppedImage);
+      // Classify the crop rectangle against the session's copy of the full image
+      const result = await classifyCrop(selectedImage, cropRect);
       
       clearInterval(progressInterval);
       setProgress(100);
@@ -431,8 +465,10 @@ const DermaScan = () => {
                       size="sm"
                       className="absolute top-2 right-2"
                         onClick={() => {
+                          closeCropSession();
                           setSelectedImage(null);
                           setCroppedImage(null);
+                          setCropRect(null);
                           setAnalysisComplete(false);
                           setClassificationResult(null);
                         }}
@@ -453,7 +489,13 @@ const DermaScan = () => {
                           variant="outline"
                           size="sm"
                           className="absolute top-2 right-2"
-                          onClick={() => setCroppedImage(null)}
+                          onClick={() => {
+                            // The session keeps the uploaded image, so the next crop only sends a rectangle
+                            setCroppedImage(null);
+                            setCropRect(null);
+                            setAnalysisComplete(false);
+                            setClassificationResult(null);
+                          }}
                         >
                           Re-crop
                         </Button>
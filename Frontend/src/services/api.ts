@@ -6,6 +6,11 @@ export interface ClassificationResult {
   primary_condition: string;
   confidence: number;
   class_names: string[];
+  profile?: string;
+  stage?: 'fast' | 'full' | 'ensemble';
+  analysis_id?: string;
+  heatmaps?: Record<string, number[][]>;
+  member_predictions?: Record<string, number>[];
 }
 
 export interface ModelInfo {
@@ -15,10 +20,39 @@ export interface ModelInfo {
   device: string;
 }
 
+export interface StoredBlob {
+  blob_id: string;
+  created: boolean;
+  size_bytes: number;
+}
+
+export interface CropSession {
+  session_id: string;
+  width: number;
+  height: number;
+  expires_in: number;
+}
+
+export interface CropRect {
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+}
+
+export interface CropClassificationResult {
+  success: boolean;
+  session_id: string;
+  results: ClassificationResult[];
+}
+
 export interface ReportRequest {
-  image: string;
-  analysis_data: Record<string, any>;
+  image?: string;
+  blob_id?: string;
+  analysis_data?: Record<string, any>;
+  analysis_id?: string;
   patient_name?: string;
+  include_heatmap?: boolean;
 }
 
 class ApiService {
@@ -44,13 +78,21 @@ class ApiService {
     return response.json();
   }
 
-  async classifyImage(imageData: string): Promise<ClassificationResult> {
+  async classifyImage(imageData: string, explain: boolean = false): Promise<ClassificationResult> {
+    return this.classify({ image: imageData, explain });
+  }
+
+  async classifyBlob(blobId: string, explain: boolean = false): Promise<ClassificationResult> {
+    return this.classify({ blob_id: blobId, explain });
+  }
+
+  private async classify(body: Record<string, any>): Promise<ClassificationResult> {
     const response = await fetch(`${this.baseUrl}/classify`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ image: imageData }),
+      body: JSON.stringify(body),
     });
 
     if (!response.ok) {
@@ -61,6 +103,62 @@ class ApiService {
     return response.json();
   }
 
+  async uploadBlob(imageData: string): Promise<StoredBlob> {
+    const response = await fetch(`${this.baseUrl}/blobs`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ image: imageData }),
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || errorData.error || `Image upload failed: ${response.statusText}`);
+    }
+
+    return response.json();
+  }
+
+  async createCropSession(imageData: string): Promise<CropSession> {
+    const response = await fetch(`${this.baseUrl}/sessions`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ image: imageData }),
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || errorData.error || `Session creation failed: ${response.statusText}`);
+    }
+
+    return response.json();
+  }
+
+  // Crops are in original image pixels (the cropper's crop scaled by naturalWidth / width)
+  async classifyCrops(sessionId: string, crops: CropRect[]): Promise<CropClassificationResult> {
+    const response = await fetch(`${this.baseUrl}/sessions/${sessionId}/classify`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ crops }),
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || errorData.error || `Crop classification failed: ${response.statusText}`);
+    }
+
+    return response.json();
+  }
+
+  async deleteCropSession(sessionId: string): Promise<void> {
+    await fetch(`${this.baseUrl}/sessions/${sessionId}`, { method: 'DELETE' });
+  }
+
   async generateReport(request: ReportRequest): Promise<Blob> {
     const response = await fetch(`${this.baseUrl}/generate-report`, {
       method: 'POST',